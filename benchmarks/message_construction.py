@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+PprzMessage construction benchmark
+
+Compares the construction of messages through the interned descriptors with the
+PprzMessage of a baseline revision, by default the one before descriptors, which
+resolved the definition through the messages_xml_map getters on every call.
+
+The pprzlink package of the baseline revision is extracted with `git archive`, both
+versions are timed by the same code in their own interpreter.
+
+    python -m benchmarks.message_construction
+    python -m benchmarks.message_construction --baseline <git revision>
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+root_dir = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+default_messages_file = os.path.join(root_dir, 'pprzlink', 'messages.xml')
+
+CASES = [
+    ("receive ROTORCRAFT_FP (ids)", (1, 147)),
+    ("send DESIRED_SETPOINT (names)", ('datalink', 'DESIRED_SETPOINT')),
+]
+
+# run in the directory of the pprzlink package to time, prints the best time of each case
+TIMING_SCRIPT = """
+import json, sys, timeit
+from pprzlink import messages_xml_map
+from pprzlink.message import PprzMessage
+messages_file, number, cases = json.loads(sys.argv[1])
+messages_xml_map.parse_messages(messages_file)
+print(json.dumps([min(timeit.repeat(lambda: PprzMessage(class_name, msg), number=number, repeat=3))
+                  for class_name, msg in cases]))
+"""
+
+
+def time_revision(package_dir, messages_file, number):
+    """Best time of each case with the pprzlink package found in package_dir"""
+    env = dict(os.environ)
+    env.pop('PYTHONPATH', None)
+    output = subprocess.check_output([sys.executable, '-c', TIMING_SCRIPT,
+                                      json.dumps([messages_file, number, [c for _, c in CASES]])],
+                                     cwd=package_dir, env=env)
+    return json.loads(output.decode())
+
+
+def default_baseline():
+    """Revision before the one adding PprzMessageDescriptor, found in the history of message.py"""
+    output = subprocess.check_output(['git', 'log', '--reverse', '-S', 'PprzMessageDescriptor', '--format=%H',
+                                      '--', 'pprzlink/message.py'], cwd=root_dir).decode().split()
+    if not output:
+        raise RuntimeError("Error: no commit adding PprzMessageDescriptor, give the revision with --baseline")
+    return output[0] + '^'
+
+
+def extract_revision(revision, directory):
+    """Extract the pprzlink package of a git revision in directory"""
+    archive = os.path.join(directory, 'pprzlink.tar')
+    subprocess.check_call(['git', 'archive', '-o', archive, revision, 'pprzlink'], cwd=root_dir)
+    with tarfile.open(archive) as tar:
+        tar.extractall(directory)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PprzMessage construction benchmark")
+    parser.add_argument("-f", "--file", help="path to messages.xml file", default=default_messages_file)
+    parser.add_argument("-n", "--number", help="number of messages per run", default=200000, type=int)
+    parser.add_argument("-b", "--baseline", help="git revision to compare with, "
+                        "by default the one before PprzMessageDescriptor")
+    args = parser.parse_args()
+    messages_file = os.path.abspath(args.file)
+    baseline = args.baseline or default_baseline()
+
+    with tempfile.TemporaryDirectory() as baseline_dir:
+        extract_revision(baseline, baseline_dir)
+        before = time_revision(baseline_dir, messages_file, args.number)
+    after = time_revision(root_dir, messages_file, args.number)
+
+    print("baseline: %s" % baseline)
+    print("%-32s %16s %16s %8s" % ("case", "before (msg/s)", "after (msg/s)", "speedup"))
+    for (label, _), b, a in zip(CASES, before, after):
+        print("%-32s %16.0f %16.0f %7.1fx" % (label, args.number / b, args.number / a, b / a))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Serial receive path benchmark
+
+Streams ROTORCRAFT_FP frames through a pseudo-terminal into a SerialMessagesInterface
+and reports the throughput and the CPU time spent by the reader thread for each mode.
+
+    python -m benchmarks.serial_read -b 230400 -t 5
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import pty
+import time
+
+from pprzlink import messages_xml_map
+from pprzlink.message import PprzMessage
+from pprzlink.pprz_transport import PprzTransport
+from pprzlink.serial import SerialMessagesInterface, READ_BYTE, READ_WAITING, READ_BLOCK
+
+default_messages_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pprzlink', 'messages.xml')
+
+
+class TimedSerialMessagesInterface(SerialMessagesInterface):
+    """serial interface recording the CPU time of its reader thread"""
+    def run(self):
+        start = time.thread_time()
+        try:
+            SerialMessagesInterface.run(self)
+        finally:
+            self.cpu_time = time.thread_time() - start
+
+
+def make_frames(nb_aircraft):
+    trans = PprzTransport()
+    frames = []
+    for ac_id in range(1, nb_aircraft + 1):
+        msg = PprzMessage('telemetry', 'ROTORCRAFT_FP')
+        for idx, name in enumerate(msg.fieldnames):
+            msg[name] = 1000 * ac_id + idx
+        frames.append(trans.pack_pprz_msg(ac_id, msg))
+    return frames
+
+
+def writer(fd, frames, baudrate, duration, stats):
+    """write frames in a loop, paced at the serial byte rate (8N1) unless baudrate is 0"""
+    byte_rate = baudrate / 10.
+    written = 0
+    start = time.monotonic()
+    while time.monotonic() - start < duration:
+        for frame in frames:
+            os.write(fd, frame)
+            written += len(frame)
+            stats['messages'] += 1
+        if byte_rate > 0:
+            delay = start + written / byte_rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    stats['bytes'] = written
+
+
+def run_mode(read_mode, frames, baudrate, duration):
+    master, slave = pty.openpty()
+    received = [0]
+
+    def callback(sender_id, msg):
+        received[0] += 1
+
+    interface = TimedSerialMessagesInterface(callback, device=os.ttyname(slave), baudrate=baudrate or 230400,
+                                             read_mode=read_mode)
+    sent = {'messages': 0, 'bytes': 0}
+    interface.start()
+    start = time.monotonic()
+    writer(master, frames, baudrate, duration, sent)
+    # let the reader drain what is left in the pty
+    drain_start = time.monotonic()
+    while received[0] < sent['messages'] and time.monotonic() - drain_start < 2.:
+        time.sleep(0.01)
+    elapsed = time.monotonic() - start
+    interface.running = False
+    interface.join()
+    interface.ser.close()
+    os.close(master)
+    os.close(slave)
+    return sent, received[0], elapsed, interface.cpu_time
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serial receive path benchmark")
+    parser.add_argument("-f", "--file", help="path to messages.xml file", default=default_messages_file)
+    parser.add_argument("-b", "--baudrate", help="simulated baudrate, 0 to write as fast as possible",
+                        dest='baud', default=230400, type=int)
+    parser.add_argument("-n", "--nb_aircraft", help="number of aircraft streaming ROTORCRAFT_FP",
+                        dest='nb_aircraft', default=4, type=int)
+    parser.add_argument("-t", "--time", help="duration of each run in seconds", dest='duration', default=5., type=float)
+    parser.add_argument("-m", "--modes", help="reader modes to compare", nargs='+',
+                        default=[READ_BYTE, READ_WAITING, READ_BLOCK])
+    args = parser.parse_args()
+    messages_xml_map.parse_messages(args.file)
+    frames = make_frames(args.nb_aircraft)
+
+    print("%-8s %12s %12s %10s %14s" % ("mode", "messages", "bytes/s", "cpu (s)", "cpu/msg (us)"))
+    for mode in args.modes:
+        sent, received, elapsed, cpu_time = run_mode(mode, frames, args.baud, args.duration)
+        cpu_per_msg = 1e6 * cpu_time / received if received else float('nan')
+        nb_bytes = sent['bytes'] * received / sent['messages'] if sent['messages'] else 0
+        print("%-8s %6d/%-6d %11.0f %10.3f %14.2f" % (mode, received, sent['messages'], nb_bytes / elapsed,
+                                                     cpu_time, cpu_per_msg))
+
+
+if __name__ == '__main__':
+    main()
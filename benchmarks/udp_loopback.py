@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+UDP link benchmark on the loopback interface
+
+A separate process simulates a fleet sending ROTORCRAFT_FP at a fixed rate (one datagram per
+aircraft and message) to a UdpMessagesInterface. For each receive mode, the received messages
+and the CPU time of the reader thread are reported, then the time to send one setpoint per
+aircraft (one control tick) with sendto or as a batch.
+
+    python -m benchmarks.udp_loopback -n 100 -r 50 -t 5
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import multiprocessing
+import os
+import socket
+import time
+
+from pprzlink import messages_xml_map
+from pprzlink.message import PprzMessage
+from pprzlink.mmsg import mmsg_available
+from pprzlink.pprz_transport import PprzTransport
+from pprzlink.udp import UdpMessagesInterface
+
+default_messages_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pprzlink', 'messages.xml')
+
+# receive modes: (name, batch_size, use_mmsg)
+MODES = [('single', 0, False), ('drain', 64, False), ('mmsg', 64, True)]
+
+
+class TimedUdpMessagesInterface(UdpMessagesInterface):
+    """UDP interface recording the CPU time of its reader thread"""
+    def run(self):
+        start = time.thread_time()
+        try:
+            UdpMessagesInterface.run(self)
+        finally:
+            self.cpu_time = time.thread_time() - start
+
+
+def make_frames(nb_aircraft):
+    trans = PprzTransport()
+    frames = []
+    for ac_id in range(1, nb_aircraft + 1):
+        msg = PprzMessage('telemetry', 'ROTORCRAFT_FP')
+        for idx, name in enumerate(msg.fieldnames):
+            msg[name] = 10 * ac_id + idx
+        frames.append(trans.pack_pprz_msg(ac_id, msg))
+    return frames
+
+
+def fleet(frames, port, rate, duration, sent):
+    """send the frame of every aircraft at rate (Hz), on absolute deadlines"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = ('127.0.0.1', port)
+    period = 1. / rate
+    start = time.monotonic()
+    tick = 0
+    while time.monotonic() - start < duration:
+        for frame in frames:
+            sock.sendto(frame, address)
+        tick += 1
+        delay = start + tick * period - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+    sent.value = tick * len(frames)
+    sock.close()
+
+
+def run_receive(mode, frames, port, rate, duration):
+    name, batch_size, use_mmsg = mode
+    received = [0]
+
+    def callback(sender_id, address, msg, length, receiver_id, component_id):
+        received[0] += 1
+
+    interface = TimedUdpMessagesInterface(callback, downlink_port=port, uplink_port=port + 1,
+                                          batch_size=batch_size, use_mmsg=use_mmsg)
+    interface.server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    # short timeouts to stop quickly at the end of the run
+    interface.timeout = 0.1
+    if batch_size == 0:
+        interface.server.settimeout(0.1)
+    sent = multiprocessing.Value('l', 0)
+    interface.start()
+    sender = multiprocessing.Process(target=fleet, args=(frames, port, rate, duration, sent))
+    sender.start()
+    sender.join()
+    time.sleep(0.2)
+    interface.running = False
+    interface.join()
+    interface.server.close()
+    return sent.value, received[0], interface.cpu_time
+
+
+def run_send(frames, port, batch_size, use_mmsg, ticks):
+    """mean time (us) to send one frame per aircraft to the uplink port"""
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sink.bind(('127.0.0.1', port + 1))
+    interface = UdpMessagesInterface(None, downlink_port=port, uplink_port=port + 1,
+                                     batch_size=batch_size, use_mmsg=use_mmsg)
+    msg = PprzMessage('datalink', 'DESIRED_SETPOINT')
+    start = time.perf_counter()
+    for _ in range(ticks):
+        with interface.batch():
+            for ac_id in range(1, len(frames) + 1):
+                msg['ac_id'] = ac_id
+                interface.send(msg, 0, '127.0.0.1', ac_id)
+        # drop what the sink received, outside of the measure
+        pause = time.perf_counter()
+        sink.setblocking(False)
+        try:
+            while True:
+                sink.recv(2048)
+        except BlockingIOError:
+            pass
+        start += time.perf_counter() - pause
+    elapsed = time.perf_counter() - start
+    interface.server.close()
+    sink.close()
+    return 1e6 * elapsed / ticks
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="UDP link benchmark on the loopback interface")
+    parser.add_argument("-f", "--file", help="path to messages.xml file", default=default_messages_file)
+    parser.add_argument("-n", "--nb_aircraft", help="number of simulated aircraft", dest='nb_aircraft', default=100, type=int)
+    parser.add_argument("-r", "--rate", help="telemetry rate of each aircraft (Hz)", dest='rate', default=50., type=float)
+    parser.add_argument("-t", "--time", help="duration of each run in seconds", dest='duration', default=5., type=float)
+    parser.add_argument("-p", "--port", help="downlink port, the uplink is on the next one", dest='port', default=4252, type=int)
+    parser.add_argument("--ticks", help="number of control ticks sent in the uplink test", dest='ticks', default=200, type=int)
+    args = parser.parse_args()
+    messages_xml_map.parse_messages(args.file)
+    frames = make_frames(args.nb_aircraft)
+    modes = [m for m in MODES if not m[2] or mmsg_available()]
+
+    print("downlink: %d aircraft at %.0f Hz" % (args.nb_aircraft, args.rate))
+    print("%-8s %16s %10s %14s" % ("mode", "received", "cpu (s)", "cpu/msg (us)"))
+    for mode in modes:
+        sent, received, cpu_time = run_receive(mode, frames, args.port, args.rate, args.duration)
+        cpu_per_msg = 1e6 * cpu_time / received if received else float('nan')
+        print("%-8s %8d/%-7d %10.3f %14.2f" % (mode[0], received, sent, cpu_time, cpu_per_msg))
+
+    print("uplink: one setpoint per aircraft and tick")
+    print("%-8s %14s" % ("mode", "tick (us)"))
+    for name, batch_size, use_mmsg in modes:
+        print("%-8s %14.1f" % (name, run_send(frames, args.port, batch_size, use_mmsg, args.ticks)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import time
+import numpy as np
+
+
+class FleetState:
+    """
+    State of all the vehicles of a fleet, stored as contiguous arrays (struct of arrays)
+
+    Each vehicle gets a dense slot, i.e. a row of the arrays, when it is added.
+    Telemetry callbacks write the rows in place and the control loop reads the
+    arrays, or views of them, without copying.
+    """
+    ARRAYS = ('position', 'velocity', 'attitude', 'timestamp')
+
+    def __init__(self, capacity=16):
+        self.ids = []       # ac_id of each slot, None for free slots
+        self._slots = {}    # ac_id -> slot
+        self._free = []     # slots of the vehicles that left, reused first
+        self.position = np.zeros((capacity, 3))     # NED position (m)
+        self.velocity = np.zeros((capacity, 3))     # NED velocity (m/s)
+        self.attitude = np.zeros((capacity, 3))     # phi, theta, psi (rad)
+        self.timestamp = np.zeros(capacity)         # time.monotonic() of the last update, 0 if never updated
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, ac_id):
+        return ac_id in self._slots
+
+    def add(self, ac_id):
+        """Get the slot of a vehicle, allocated if it is a new one"""
+        slot = self._slots.get(ac_id)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+                self.ids[slot] = ac_id
+            else:
+                slot = len(self.ids)
+                if slot == len(self.timestamp):
+                    self._grow(2 * slot)
+                self.ids.append(ac_id)
+            self._slots[ac_id] = slot
+        return slot
+
+    def remove(self, ac_id):
+        """Free the slot of a vehicle leaving the fleet, its state is cleared"""
+        slot = self._slots.pop(ac_id, None)
+        if slot is None:
+            return
+        self.ids[slot] = None
+        self.position[slot] = 0.
+        self.velocity[slot] = 0.
+        self.attitude[slot] = 0.
+        self.timestamp[slot] = 0.
+        self._free.append(slot)
+
+    def _grow(self, capacity):
+        # views kept on the previous arrays are not updated anymore, vehicles access their rows by slot
+        for name in self.ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:])
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def snapshot(self):
+        """
+        Copy of the state with the same slots
+
+        Gives a control tick a consistent view of the fleet while the callbacks keep updating this one.
+        """
+        snap = FleetState.__new__(FleetState)
+        snap.ids = list(self.ids)
+        snap._slots = dict(self._slots)
+        snap._free = list(self._free)
+        for name in self.ARRAYS:
+            setattr(snap, name, getattr(self, name).copy())
+        return snap
+
+    def slot(self, ac_id):
+        """Get the slot of a vehicle, None if unknown"""
+        return self._slots.get(ac_id)
+
+    def touch(self, slot):
+        """Mark the state of slot as updated now"""
+        self.timestamp[slot] = time.monotonic()
+
+    def updated_slots(self):
+        """Slots of the vehicles that received at least one update"""
+        return np.flatnonzero(self.timestamp[:len(self.ids)] > 0)
+
+
+class VehicleRegistry:
+    """
+    Vehicles of the fleet by ac_id, with O(1) lookup from telemetry callbacks
+
+    Vehicles can join and leave at any time, their slots in the fleet state are
+    allocated and freed accordingly. Iteration follows the joining order.
+    """
+    def __init__(self, fleet):
+        self.fleet = fleet
+        self._vehicles = {}
+
+    def __len__(self):
+        return len(self._vehicles)
+
+    def __contains__(self, ac_id):
+        return ac_id in self._vehicles
+
+    def __iter__(self):
+        # on a copy, vehicles may join or leave while iterating
+        return iter(list(self._vehicles.values()))
+
+    def get(self, ac_id):
+        """Get a vehicle by id, None if unknown"""
+        return self._vehicles.get(ac_id)
+
+    def ids(self):
+        return list(self._vehicles)
+
+    def add(self, vehicle):
+        self._vehicles[vehicle.id] = vehicle
+
+    def remove(self, ac_id):
+        """Remove a vehicle and free its slot, return it (None if unknown)"""
+        vehicle = self._vehicles.pop(ac_id, None)
+        self.fleet.remove(ac_id)
+        return vehicle
+
+    def update(self, ac_ids, factory):
+        """
+        Make the registry match the list of ids
+
+        New vehicles are created with factory(ac_id), vehicles already known are kept as is.
+        :return: lists of added and removed vehicles
+        """
+        ac_ids = list(ac_ids)
+        removed = [self.remove(_id) for _id in list(self._vehicles) if _id not in ac_ids]
+        added = []
+        for _id in ac_ids:
+            if _id not in self._vehicles:
+                vehicle = factory(_id)
+                self.add(vehicle)
+                added.append(vehicle)
+        return added, removed
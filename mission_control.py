@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 from __future__ import print_function
 
+import logging
 import sys
 from os import path, getenv
 
@@ -21,8 +22,28 @@ import numpy as np
 #from pprzlink.ivy import IvyMessagesInterface
 
 from pprzlink.message import PprzMessage
+from pprzlink.dispatcher import Dispatcher, DROP_OLDEST
+from pprzlink.mailbox import Mailbox
+from pprzlink.recorder import FlightRecorder
 
-from vector_fields import TrajectoryEllipse, ParametricTrajectory, spheric_geo_fence, repel, Controller
+from vector_fields import TrajectoryEllipse, ParametricTrajectory, spheric_geo_fence, repel_sources, Controller
+from spatial_index import UniformGrid
+from fleet_state import FleetState, VehicleRegistry
+from scheduler import FixedRateScheduler
+from vehicle_pool import VehiclePool
+
+
+logger = logging.getLogger(__name__)
+
+
+def record(recorder, method, *args):
+    """Call a FlightRecorder method, a recorder failure never gets in the way of the control loop"""
+    if recorder is None:
+        return
+    try:
+        getattr(recorder, method)(*args)
+    except Exception:
+        logger.exception("Error while recording, %s" % method)
 
 
 class Commands():
@@ -92,6 +113,7 @@ class Commands():
         msg['uy'] = east
         msg['uz'] = down
         self._interface.send(msg)
+        record(getattr(self._interface, 'recorder', None), 'record_command', self._ac_id, flag, north, east, down)
 
 
 class FlightStatus(object):
@@ -148,16 +170,16 @@ class FlightStatus(object):
 
 
 class Vehicle(object):
-    def __init__(self, ac_id, interface):
+    def __init__(self, ac_id, interface, fleet=None):
         self._initialized = False
         self._take_off = False
         self._land = False
         self._ac_id = ac_id
         self._interface = interface
         self._position_initial = np.zeros(3) # Initial Position for safely landing after Ctrl+C
-        self._position = np.zeros(3) # Position
-        self._velocity = np.zeros(3) # Velocity
-        self.W = np.zeros(3) # Angles
+        # Position, velocity and angles are rows of the shared fleet state
+        self._fleet = fleet if fleet is not None else FleetState(capacity=1)
+        self._slot = self._fleet.add(ac_id)
         self.gvf_parameter = 0
         self.sm = None  # settings manager
         self.timeout = 0
@@ -167,7 +189,7 @@ class Vehicle(object):
 
         self.ka = 1.6 #acceleration setpoint coeff
         self.circle_vel = 0.6 #m/s
-        self.belief_map = {}
+        self.belief_positions = np.zeros((0, 3)) # (N,3) positions of the other vehicles
 
     def __str__(self):
         conf_str = f'A/C ID {self._ac_id}'
@@ -177,6 +199,26 @@ class Vehicle(object):
     def id(self):
         return self._ac_id
 
+    @property
+    def slot(self):
+        return self._slot
+
+    def bind(self, fleet):
+        """Read the state from fleet, a snapshot of the fleet state with the same slots"""
+        self._fleet = fleet
+
+    @property
+    def _position(self):
+        return self._fleet.position[self._slot] # Position
+
+    @property
+    def _velocity(self):
+        return self._fleet.velocity[self._slot] # Velocity
+
+    @property
+    def W(self):
+        return self._fleet.attitude[self._slot] # Angles
+
     @property
     def state(self):
         return self._state
@@ -203,12 +245,8 @@ class Vehicle(object):
             V_des += spheric_geo_fence(position[0], position[1], position[2], x_source=0., y_source=0., z_source=0., strength=-0.07)
         else:
             V_des += spheric_geo_fence(self._position[0], self._position[1], self._position[2], x_source=0., y_source=0., z_source=0., strength=-0.07)
-        for _k in self.belief_map.keys():
-            # float(self.belief_map[_k]['X'])
-            V_des += repel(self._position[0], self._position[1], self._position[2], 
-                    x_source=float(self.belief_map[_k]['X']), 
-                    y_source=float(self.belief_map[_k]['Y']), 
-                    z_source=float(self.belief_map[_k]['Z']), strength=5.0)
+        V_des += repel_sources(self._position[0], self._position[1], self._position[2],
+                               self.belief_positions, strength=5.0)
 
         return V_des
 
@@ -223,7 +261,7 @@ class Vehicle(object):
         # return acc
 
 
-    def calculate_cmd(self, mission_task):
+    def calculate_cmd(self, mission_task, dt=0.1):
         V_des = self.get_vector_field(self.fs.task)
 
         if mission_task == 'takeoff':
@@ -255,9 +293,9 @@ class Vehicle(object):
             # import pdb
             # pdb.set_trace()
             # print(f'Shape of V_des : {V_des_increment.shape}')
-            # print(f'dt : {0.1}, parameter : {self.gvf_parameter} ')
+            # print(f'dt : {dt}, parameter : {self.gvf_parameter} ')
             V_des += V_des_increment 
-            self.gvf_parameter += -uw[0]*0.1 #dt
+            self.gvf_parameter += -uw[0]*dt
 
             # Getting and setting the navigation heading of the vehicles
             # print(f'Nav heading value is : {self.sm["nav_heading"]}')
@@ -267,7 +305,6 @@ class Vehicle(object):
 
             self.send_acceleration(V_des, A_3D=True)
 
-        # print(self.belief_map.keys())
         elif mission_task == 'nav2land':
             print('We are going for landing!!!')
             self.send_acceleration(V_des) # This is 2D with fixed 2m altitude height AGL
@@ -286,10 +323,10 @@ class Vehicle(object):
         # else mission_task == 'kill' :
 
 
-    def run(self):
+    def run(self, dt=0.1):
         # while True:
         print(f'Running the vehicle {self._ac_id} in {self.fs.task} state ')
-        self.calculate_cmd(self.fs.task)
+        self.calculate_cmd(self.fs.task, dt)
 
 
 
@@ -298,14 +335,17 @@ def new_ac(conf):
     print(conf)
 
 class SingleControl(object):
-    def __init__(self, verbose=False, interface=None, quad_ids = None):
+    def __init__(self, verbose=False, interface=None, quad_ids = None, influence_radius=None):
         self.verbose = verbose
         self._interface = interface
+        self.influence_radius = influence_radius # only vehicles closer than this are in the belief map, None for all
+        self._spatial_index = UniformGrid(cell_size=influence_radius or 1.0)
         # self._connect = pprz_connect.PprzConnect(notify=new_ac, ivy=self._interface, verbose=False)
         # if self._interface == None : self._interface = self._connect.ivy
         # time.sleep(0.5)
         # self._vehicle_id_list={}
-        self._vehicle_position_map = {}
+        self.fleet = FleetState()
+        self.vehicles = VehicleRegistry(self.fleet)
         self.update_vehicle_list()
         self.define_interface_callback()
         time.sleep(0.5)
@@ -316,28 +356,28 @@ class SingleControl(object):
             # print(self._vehicle_id_list)
             # ac_id = int(msg['ac_id'])
             # print(ac_id)
-            if ac_id in self._vehicle_id_list and msg.name == "ROTORCRAFT_FP":
-                rc = self.vehicles[self._vehicle_id_list.index(ac_id)]
+            rc = self.vehicles.get(ac_id)
+            if rc is not None and msg.name == "ROTORCRAFT_FP":
                 i2p = 1. / 2**8     # integer to position
                 i2v = 1. / 2**19    # integer to velocity
                 i2w = 1. / 2**12     # integer to angle
-                rc._position[0] = float(msg['north']) * i2p
-                rc._position[1] = float(msg['east']) * i2p
-                rc._position[2] = float(msg['up']) * i2p
-                rc._velocity[0] = float(msg['vnorth']) * i2v
-                rc._velocity[1] = float(msg['veast']) * i2v
-                rc._velocity[2] = float(msg['vup']) * i2v
-                rc.W[2] = float(msg['psi']) * i2w
-                self._vehicle_position_map[ac_id] = {'X':rc._position[0],'Y':rc._position[1],'Z':rc._position[2]}
+                slot = rc.slot
+                self.fleet.position[slot] = (msg['north'] * i2p, msg['east'] * i2p, msg['up'] * i2p)
+                self.fleet.velocity[slot] = (msg['vnorth'] * i2v, msg['veast'] * i2v, msg['vup'] * i2v)
+                self.fleet.attitude[slot] = (msg['phi'] * i2w, msg['theta'] * i2w, msg['psi'] * i2w)
+                self.fleet.touch(slot)
                 rc.timeout = 0
                 rc._initialized = True
 
-        self._interface.callback = rotorcraft_fp_cb
+        # callbacks run on a dispatcher thread, the serial reader never waits for them
+        # only the periodic telemetry is conflated, any other message is delivered
+        self._dispatcher = Dispatcher(rotorcraft_fp_cb, policies={'ROTORCRAFT_FP': DROP_OLDEST})
+        self._interface.callback = self._dispatcher
         self._interface.start()
 
     def update_vehicle_list(self):
-        self._vehicle_id_list=[42]#[int(_id) for _id in self._connect.conf_by_id().keys()]
-        self.vehicles = [Vehicle(id, self._interface) for id in self._vehicle_id_list]
+        # vehicles already known are kept, others join or leave
+        self.vehicles.update([42], lambda _id: Vehicle(_id, self._interface, self.fleet))#[int(_id) for _id in self._connect.conf_by_id().keys()]
         # self.vehicle = Vehicle(42,self._interface)
         # self.create_vehicles()
 
@@ -347,31 +387,38 @@ class SingleControl(object):
 
     def assign(self,mission_plan_dict):
         i=0
-        for _id in self._vehicle_id_list:
-            print(f'Vehicle id :{_id} mission plan updated ! ')
-            rc = self.vehicles[self._vehicle_id_list.index(_id)]
+        for rc in self.vehicles:
+            print(f'Vehicle id :{rc.id} mission plan updated ! ')
             # rc.sm = settings.PprzSettingsManager(self._connect.conf_by_id(str(rc.id)).settings, str(rc.id), self._connect.ivy)
             rc.fs.set_mission_plan(mission_plan_dict)
-            rc.gvf_parameter = (len(self._vehicle_id_list)-i)*30.
+            rc.gvf_parameter = (len(self.vehicles)-i)*30.
             i+=1
     
     def assign_vehicle_properties(self):
-        for _id in self._vehicle_id_list:
-            rc = self.vehicles[self._vehicle_id_list.index(_id)]
+        for rc in self.vehicles:
             rc.assign_properties()
                
+    def update_spatial_index(self):
+        # rebuilt once per tick from the positions of the vehicles with telemetry
+        slots = self.fleet.updated_slots()
+        self._spatial_index.rebuild([self.fleet.ids[_s] for _s in slots], self.fleet.position[slots])
+
     def update_belief_map(self, vehicle):
-        for _k in self._vehicle_position_map.keys():
-            if _k != vehicle._ac_id:
-                vehicle.belief_map[_k] = self._vehicle_position_map[_k]
+        vehicle.belief_positions = self._spatial_index.neighbours(vehicle._position, self.influence_radius,
+                                                                  exclude=vehicle._ac_id)
 
-    def run_vehicle(self):
-        for _id in self._vehicle_id_list:
-            rc = self.vehicles[self._vehicle_id_list.index(_id)]
+    def run_vehicle(self, dt=0.1):
+        self.update_spatial_index()
+        recorder = getattr(self._interface, 'recorder', None)
+        for rc in self.vehicles:
             self.update_belief_map(rc)
-            rc.run()
+            record(recorder, 'record_state', rc.id, rc._position, rc._velocity, rc.W)
+            rc.run(dt)
 
     def shutdown(self):
+        if getattr(self, '_dispatcher', None) is not None:
+            self._dispatcher.stop(1.0)
+            self._dispatcher = None
         if self._interface is not None:
             print("Shutting down THE interface...")
             self._interface.shutdown()
@@ -381,71 +428,102 @@ class SingleControl(object):
         self.shutdown()
 
 class MissionControl(object):
-    def __init__(self, verbose=False, interface=None, quad_ids = None):
+    def __init__(self, verbose=False, interface=None, quad_ids = None, influence_radius=None, workers=0):
         self.verbose = verbose
         self._interface = interface
+        self._pool = VehiclePool(workers) if workers > 0 else None # vehicles run in sequence without workers
+        self.influence_radius = influence_radius # only vehicles closer than this are in the belief map, None for all
+        self._spatial_index = UniformGrid(cell_size=influence_radius or 1.0)
         self._connect = pprz_connect.PprzConnect(notify=new_ac, ivy=self._interface, verbose=False)
         if self._interface == None : self._interface = self._connect.ivy
         time.sleep(0.5)
         # self._vehicle_id_list={}
-        self._vehicle_position_map = {}
+        self.fleet = FleetState()
+        self.vehicles = VehicleRegistry(self.fleet)
+        self.mailbox = Mailbox() # newest telemetry of each vehicle, applied once per tick
+        self._telemetry_handlers = {} # message name -> callback applying it
+        self._telemetry_seq = 0 # last mailbox sequence number applied
         self.update_vehicle_list()  # self.create_vehicles()
         self.subscribe_to_msg()
         time.sleep(0.5)
         # self.assign_vehicle_properties()
 
-    def run_every_vehicle(self):
-        # Once it is threaded, below lines can be used to start each vehicles runtime
-        for _id in self._vehicle_id_list:
-            rc = self.vehicles[self._vehicle_id_list.index(_id)]
-            # print(f'Vehicle id :{_id} and its index :{self._vehicle_id_list.index(_id)} Position {rc._position[1]}')
+    def run_every_vehicle(self, dt=0.1):
+        self.update_telemetry()
+        # Every vehicle of the tick works from the same snapshot, callbacks keep updating self.fleet
+        snapshot = self.fleet.snapshot()
+        self.update_spatial_index(snapshot)
+        vehicles = list(self.vehicles)
+        recorder = getattr(self._interface, 'recorder', None)
+        for rc in vehicles:
+            # print(f'Vehicle id :{rc.id} and its slot :{rc.slot} Position {rc._position[1]}')
+            rc.bind(snapshot)
             self.update_belief_map(rc)
-            rc.run()
+            record(recorder, 'record_state', rc.id, rc._position, rc._velocity, rc.W)
+        try:
+            if self._pool is None:
+                for rc in vehicles:
+                    rc.run(dt)
+            else:
+                self._pool.run(vehicles, lambda rc: rc.run(dt)) # returns when all the vehicles are done
+        finally:
+            for rc in vehicles:
+                rc.bind(self.fleet)
 
     def assign(self,mission_plan_dict):
         i=0
-        for _id in self._vehicle_id_list:
-            print(f'Vehicle id :{_id} mission plan updated ! ')
-            rc = self.vehicles[self._vehicle_id_list.index(_id)]
+        for rc in self.vehicles:
+            print(f'Vehicle id :{rc.id} mission plan updated ! ')
             rc.sm = settings.PprzSettingsManager(self._connect.conf_by_id(str(rc.id)).settings, str(rc.id), self._connect.ivy)
             rc.fs.set_mission_plan(mission_plan_dict)
-            rc.gvf_parameter = (len(self._vehicle_id_list)-i)*30.
+            rc.gvf_parameter = (len(self.vehicles)-i)*30.
             i+=1
 
 
     def assign_vehicle_properties(self):
-        for _id in self._vehicle_id_list:
-            rc = self.vehicles[self._vehicle_id_list.index(_id)]
+        for rc in self.vehicles:
             rc.assign_properties()
 
+    def update_spatial_index(self, fleet=None):
+        # rebuilt once per tick from the positions of the vehicles with telemetry
+        fleet = fleet if fleet is not None else self.fleet
+        slots = fleet.updated_slots()
+        self._spatial_index.rebuild([fleet.ids[_s] for _s in slots], fleet.position[slots])
+
     def update_belief_map(self, vehicle):
-        for _k in self._vehicle_position_map.keys():
-            if _k != vehicle._ac_id:
-                vehicle.belief_map[_k] = self._vehicle_position_map[_k]
+        vehicle.belief_positions = self._spatial_index.neighbours(vehicle._position, self.influence_radius,
+                                                                  exclude=vehicle._ac_id)
+
+    def update_telemetry(self):
+        # only the newest sample of each vehicle received since the previous tick is applied
+        self._telemetry_seq, samples = self.mailbox.updates(self._telemetry_seq)
+        for ac_id, name, timestamp, msg in samples:
+            handler = self._telemetry_handlers.get(name)
+            if handler is not None:
+                handler(ac_id, msg)
 
     def update_vehicle_list(self):
         self._connect.get_aircrafts() # Not sure if we need that all the time, as it is subscribed for every NEW_AIRCRAFT...
         self.create_vehicles()
 
     def create_vehicles(self):
-        self._vehicle_id_list=[int(_id) for _id in self._connect.conf_by_id().keys()]
-        self.vehicles = [Vehicle(id, self._interface) for id in self._vehicle_id_list]
+        # vehicles already known are kept, others join or leave
+        self.vehicles.update([int(_id) for _id in self._connect.conf_by_id().keys()],
+                             lambda _id: Vehicle(_id, self._interface, self.fleet))
 
     def subscribe_to_msg(self):
         # bind to INS message
         def ins_cb(ac_id, msg):
             # if ac_id in self.ids and msg.name == "INS":
             #     rc = self.rotorcrafts[self.ids.index(ac_id)]
-            if ac_id in self._vehicle_id_list and msg.name == "INS":
-                rc = self.vehicles[self._vehicle_id_list.index(ac_id)]
+            rc = self.vehicles.get(ac_id)
+            if rc is not None and msg.name == "INS":
                 i2p = 1. / 2**8     # integer to position
                 i2v = 1. / 2**19    # integer to velocity
-                rc._position[0] = float(msg['ins_x']) * i2p
-                rc._position[1] = float(msg['ins_y']) * i2p
-                rc._position[2] = float(msg['ins_z']) * i2p
-                rc._velocity[0] = float(msg['ins_xd']) * i2v
-                rc._velocity[1] = float(msg['ins_yd']) * i2v
-                rc._velocity[2] = float(msg['ins_zd']) * i2v
+                slot = rc.slot
+                self.fleet.position[slot] = (msg['ins_x'] * i2p, msg['ins_y'] * i2p, msg['ins_z'] * i2p)
+                self.fleet.velocity[slot] = (msg['ins_xd'] * i2v, msg['ins_yd'] * i2v, msg['ins_zd'] * i2v)
+                self.fleet.touch(slot)
                 rc.timeout = 0
                 rc._initialized = True
         # self._interface.subscribe(ins_cb, PprzMessage("telemetry", "INS"))
@@ -455,40 +533,36 @@ class MissionControl(object):
             # print(self._vehicle_id_list)
             # ac_id = int(msg['ac_id'])
             # print(ac_id)
-            if ac_id in self._vehicle_id_list and msg.name == "ROTORCRAFT_FP":
-                rc = self.vehicles[self._vehicle_id_list.index(ac_id)]
+            rc = self.vehicles.get(ac_id)
+            if rc is not None and msg.name == "ROTORCRAFT_FP":
                 i2p = 1. / 2**8     # integer to position
                 i2v = 1. / 2**19    # integer to velocity
                 i2w = 1. / 2**12     # integer to angle
-                rc._position[0] = float(msg['north']) * i2p
-                rc._position[1] = float(msg['east']) * i2p
-                rc._position[2] = float(msg['up']) * i2p
-                rc._velocity[0] = float(msg['vnorth']) * i2v
-                rc._velocity[1] = float(msg['veast']) * i2v
-                rc._velocity[2] = float(msg['vup']) * i2v
-                rc.W[2] = float(msg['psi']) * i2w
-                self._vehicle_position_map[ac_id] = {'X':rc._position[0],'Y':rc._position[1],'Z':rc._position[2]}
+                slot = rc.slot
+                self.fleet.position[slot] = (msg['north'] * i2p, msg['east'] * i2p, msg['up'] * i2p)
+                self.fleet.velocity[slot] = (msg['vnorth'] * i2v, msg['veast'] * i2v, msg['vup'] * i2v)
+                self.fleet.attitude[slot] = (msg['phi'] * i2w, msg['theta'] * i2w, msg['psi'] * i2w)
+                self.fleet.touch(slot)
                 rc.timeout = 0
                 rc._initialized = True
         
         # Un-comment this if the quadrotors are providing state information to use_deep_guidance.py
-        self._interface.subscribe(rotorcraft_fp_cb, PprzMessage("telemetry", "ROTORCRAFT_FP"))
+        # Messages are conflated in the mailbox, rotorcraft_fp_cb is called from the control loop
+        self._telemetry_handlers["ROTORCRAFT_FP"] = rotorcraft_fp_cb
+        self._interface.subscribe(self.mailbox, PprzMessage("telemetry", "ROTORCRAFT_FP"))
     
         # bind to GROUND_REF message : ENAC Voliere is sending LTP_ENU
         def ground_ref_cb(ground_id, msg):
             ac_id = int(msg['ac_id'])
-            if ac_id in self._vehicle_id_list:
-                rc = self.vehicles[self._vehicle_id_list.index(ac_id)]
-                # X and V in NED
-                rc._position[0] = float(msg['pos'][1])
-                rc._position[1] = float(msg['pos'][0])
-                rc._position[2] = float(msg['pos'][2])
-                rc._velocity[0] = float(msg['speed'][1])
-                rc._velocity[1] = float(msg['speed'][0])
-                rc._velocity[2] = float(msg['speed'][2])
+            rc = self.vehicles.get(ac_id)
+            if rc is not None:
+                # X and V in NED (ENU swap), arrays are already decoded by the interface
+                slot = rc.slot
+                self.fleet.position[slot] = np.asarray(msg['pos'], dtype=float)[[1, 0, 2]]
+                self.fleet.velocity[slot] = np.asarray(msg['speed'], dtype=float)[[1, 0, 2]]
+                self.fleet.touch(slot)
                 # print(f'Ground REF ac_id {ac_id}')
                 # print(f'X:{rc._position[0]} Y: {rc._position[1]} Z: {rc._position[2]}')
-                self._vehicle_position_map[ac_id] = {'X':rc._position[0],'Y':rc._position[1],'Z':rc._position[2]}
                 rc.timeout = 0
                 rc._initialized = True
         
@@ -528,6 +602,9 @@ class MissionControl(object):
     # </message>
 
     def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
         if self._interface is not None:
             print("Shutting down THE interface...")
             self._interface.shutdown()
@@ -566,18 +643,37 @@ def main():
     parser.add_argument("-b", "--baudrate", help="baudrate", dest='baud', default=230400, type=int)
     parser.add_argument("-id", "--ac_id", help="aircraft id (receiver)", dest='ac_id', default=42, type=int)
     parser.add_argument("--interface_id", help="interface id (sender)", dest='id', default=0, type=int)
+    parser.add_argument("--rate", help="control loop rate (Hz)", dest='rate', default=1./0.09, type=float)
+    parser.add_argument("-w", "--workers", help="threads running the vehicles in parallel, in sequence if 0",
+                        dest='workers', default=0, type=int)
+    parser.add_argument("-r", "--influence_radius", help="only repel vehicles closer than this (m), all if not set",
+                        dest='influence_radius', default=None, type=float)
+    parser.add_argument("-l", "--log_dir", help="record the flight in this directory", dest='log_dir', default=None)
+    parser.add_argument("--replay_dir", help="flight log replayed when running on 'replay'", dest='replay_dir', default=None)
+    parser.add_argument("--speed", help="replay speed, 0 for as fast as possible", dest='speed', default=1., type=float)
     # parser.add_argument("-ti", "--target_id", dest='target_id', default=2, type=int, help="Target aircraft ID")
     # parser.add_argument("-ri", "--repel_id", dest='repel_id', default=2, type=int, help="Repellant aircraft ID")
     # parser.add_argument("-bi", "--base_id", dest='base_id', default=10, type=int, help="Base aircraft ID")
     args = parser.parse_args()
 
     if args.running_on == 'ground' :
-        interface  = IvyMessagesInterface("PprzConnect")
+        interface  = IvyMessagesInterface("PprzConnect", typed=True, numpy_arrays=True)
 
     if args.running_on == "serial" :
-        from pprzlink.serial import SerialMessagesInterface
+        from pprzlink.serial import SerialMessagesInterface, READ_WAITING, SEND_QUEUED
         interface = SerialMessagesInterface(None, device=args.dev,
-                                               baudrate=args.baud, msg_class=args.msg_class, interface_id=args.id, verbose=False)
+                                               baudrate=args.baud, msg_class=args.msg_class, interface_id=args.id, verbose=False,
+                                               read_mode=READ_WAITING, send_mode=SEND_QUEUED)
+
+    if args.running_on == "replay" :
+        from pprzlink.replay import ReplayMessagesInterface
+        interface = ReplayMessagesInterface(None, args.replay_dir, msg_class=args.msg_class, interface_id=args.id,
+                                            speed=args.speed)
+
+    recorder = None
+    if args.log_dir is not None:
+        recorder = FlightRecorder(args.log_dir)
+        interface.recorder = recorder
 
 
     mission_plan_dict={# 'takeoff' :{'start':None, 'duration':20, 'finalized':False},
@@ -590,52 +686,60 @@ def main():
     # mission_plan_dict={ 'parametric_circle'  :{'start':None, 'duration':15, 'finalized':False} }
 
     vehicle_parameter_dict={}
+    scheduler = FixedRateScheduler(rate=args.rate)
 
     if args.running_on == 'ground' :
         try:
-            mc = MissionControl(interface=interface)
+            mc = MissionControl(interface=interface, influence_radius=args.influence_radius, workers=args.workers)
             mc.assign(mission_plan_dict)
             mc.assign_vehicle_properties()
             time.sleep(1.5)
 
             while True:
-                mc.run_every_vehicle()
-                time.sleep(0.09)
+                dt = scheduler.wait()
+                mc.run_every_vehicle(dt)
 
         except (KeyboardInterrupt, SystemExit):
+            print('Control loop timing: %s' % scheduler.stats())
             mission_end_plan_dict={'safe2land'  :{'start':None, 'duration':15, 'finalized':False}, }
             mc.assign(mission_end_plan_dict)  # mc.assign_vehicle_properties()
             time.sleep(0.5)
             for i in range(10):
-                mc.run_every_vehicle()
+                mc.run_every_vehicle(0.5)
                 time.sleep(0.5)
             print('Shutting down...')
             # mc.set_nav_mode()
             mc.shutdown()
+            if recorder is not None:
+                recorder.close()
             time.sleep(0.6)
             exit()
 
-    if args.running_on == 'serial' :
+    if args.running_on in ('serial', 'replay') :
         try:
-            sc = SingleControl(interface=interface)
+            sc = SingleControl(interface=interface, influence_radius=args.influence_radius)
             sc.assign(mission_plan_dict)
             sc.assign_vehicle_properties()
             time.sleep(1.5)
 
             while True:
-                sc.run_vehicle()
-                time.sleep(0.09)
+                dt = scheduler.wait()
+                with interface.batch(): # setpoints of the tick are written at once
+                    sc.run_vehicle(dt)
 
         except (KeyboardInterrupt, SystemExit):
+            print('Control loop timing: %s' % scheduler.stats())
             mission_end_plan_dict={'safe2land'  :{'start':None, 'duration':15, 'finalized':False}, }
             sc.assign(mission_end_plan_dict) # sc.assign_vehicle_properties()
             time.sleep(0.5)
             for i in range(10):
-                sc.run_vehicle()
+                sc.run_vehicle(0.5)
                 time.sleep(0.5)
             print('Shutting down...')
             # mc.set_nav_mode()
             sc.shutdown()
+            if recorder is not None:
+                recorder.close()
             time.sleep(0.6)
             exit()
 
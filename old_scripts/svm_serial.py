@@ -196,7 +196,8 @@ def main():
     parser.add_argument("-id", "--ac_id", help="aircraft id (receiver)", dest='ac_id', default=42, type=int)
     parser.add_argument("--interface_id", help="interface id (sender)", dest='id', default=0, type=int)
     args = parser.parse_args()
-    messages_xml_map.parse_messages(args.file)
+    # only IMU telemetry is received, commands are datalink messages
+    messages_xml_map.parse_messages(args.file, msg_classes=[args.msg_class, 'datalink'])
 
     #model_filename = 'svm_model_1.joblib'
     #scaler_filename = 'svm_scaler_1.joblib'
@@ -0,0 +1,281 @@
+#
+# This file is part of PPRZLINK.
+#
+# PPRZLINK is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PPRZLINK is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PPRZLINK.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+PPRZLINK asyncio interfaces
+
+One event loop drives any number of links, without a thread per link:
+
+    link = await AioUdpLink.create(downlink_port=4242)
+    async for incoming in link:
+        print(incoming.sender_id, incoming.msg)
+
+Decoded messages are delivered through a bounded queue per link, consumed with
+`async for` or `await link.recv()`. When the consumer falls behind, the oldest
+messages are dropped and counted in `dropped`.
+"""
+
+import asyncio
+import logging
+import socket
+from collections import namedtuple
+
+from pprzlink.message import PprzMessage
+from pprzlink.pprz_transport import PprzTransport
+from pprzlink.udp import UPLINK_PORT, DOWNLINK_PORT
+
+
+logger = logging.getLogger("PprzLink")
+
+# a decoded message with its routing information, address is None for serial and Ivy links
+Incoming = namedtuple('Incoming', ['sender_id', 'receiver_id', 'component_id', 'msg', 'address'])
+
+
+class AioLink(object):
+    """
+    Base of the asyncio links: decoding, id filtering and delivery to the queue
+
+    Subclasses call `feed` from the event loop with incoming data, or `deliver` with decoded messages.
+    """
+    def __init__(self, msg_class='telemetry', interface_id=0, verbose=False, maxsize=1000):
+        self.msg_class = msg_class
+        self.id = interface_id  # set to None to disable id filtering
+        self.verbose = verbose
+        self.queue = asyncio.Queue(maxsize)
+        self.trans = PprzTransport(msg_class)
+        self.received = 0
+        self.dropped = 0
+        self.closed = False
+        self._transports = {}   # one parser per address, datagrams of different senders don't mix
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        incoming = await self.recv()
+        if incoming is None:
+            raise StopAsyncIteration
+        return incoming
+
+    async def recv(self):
+        """Wait for the next message, None once the link is closed and the queue drained"""
+        if self.closed and self.queue.empty():
+            return None
+        return await self.queue.get()
+
+    def deliver(self, incoming):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(incoming)
+
+    def feed(self, data, address=None):
+        """Decode the complete frames of data and queue the messages for this interface"""
+        trans = self.trans
+        if address is not None:
+            trans = self._transports.get(address)
+            if trans is None:
+                trans = self._transports[address] = PprzTransport(self.msg_class)
+        for frame in trans.feed(data):
+            try:
+                (sender_id, receiver_id, component_id, msg) = trans.unpack_pprz_msg(frame)
+            except ValueError as e:
+                logger.warning("Ignoring unknown message, %s" % e)
+                continue
+            if self.verbose:
+                logger.info("New incoming message '%s' from %i (%i, %s) to %i" % (msg.name, sender_id, component_id, address, receiver_id))
+            if self.id is None or self.id == receiver_id or receiver_id == 255:
+                self.received += 1
+                self.deliver(Incoming(sender_id, receiver_id, component_id, msg, address))
+
+    def close(self):
+        """Stop receiving, iterators end once the queued messages are consumed"""
+        if self.closed:
+            return
+        self.closed = True
+        # wake up a consumer waiting on an empty queue, otherwise recv() returns None once the
+        # queue is drained, no message is dropped for the sentinel
+        if self.queue.empty():
+            self.queue.put_nowait(None)
+
+
+class _UdpProtocol(asyncio.DatagramProtocol):
+    def __init__(self, link):
+        self.link = link
+
+    def datagram_received(self, data, address):
+        self.link.feed(data, address)
+
+    def error_received(self, exc):
+        logger.warning("UDP link error: %s" % exc)
+
+
+class AioUdpLink(AioLink):
+    """UDP link on an asyncio datagram endpoint"""
+    def __init__(self, uplink_port=UPLINK_PORT, downlink_port=DOWNLINK_PORT, **kwargs):
+        AioLink.__init__(self, **kwargs)
+        self.uplink_port = uplink_port
+        self.downlink_port = downlink_port
+        self.transport = None
+
+    @classmethod
+    async def create(cls, uplink_port=UPLINK_PORT, downlink_port=DOWNLINK_PORT, host='0.0.0.0', **kwargs):
+        """Create the link and bind it on downlink_port"""
+        link = cls(uplink_port, downlink_port, **kwargs)
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.bind((host, downlink_port))
+        link.transport, _ = await loop.create_datagram_endpoint(lambda: _UdpProtocol(link), sock=sock)
+        return link
+
+    def send(self, msg, sender_id, address, receiver=0, component=0):
+        """Send a message to address on the uplink port, never blocks"""
+        if isinstance(msg, PprzMessage):
+            data = self.trans.pack_pprz_msg(sender_id, msg, receiver, component)
+            self.transport.sendto(data, (address, self.uplink_port))
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        AioLink.close(self)
+
+
+class AioSerialLink(AioLink):
+    """
+    Serial link (or pty) read from the event loop when its file descriptor is readable
+
+    Only for POSIX systems, where serial ports can be polled by the selector.
+    """
+    def __init__(self, device='/dev/ttyUSB0', baudrate=115200, **kwargs):
+        import serial
+        AioLink.__init__(self, **kwargs)
+        self.device = device
+        self.ser = serial.Serial(device, baudrate, timeout=0)
+        self._loop = None
+
+    @classmethod
+    async def create(cls, device='/dev/ttyUSB0', baudrate=115200, **kwargs):
+        """Open the device and start reading it from the running loop"""
+        link = cls(device, baudrate, **kwargs)
+        link._loop = asyncio.get_running_loop()
+        link._loop.add_reader(link.ser.fileno(), link._on_readable)
+        return link
+
+    def _on_readable(self):
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except Exception as e:
+            logger.error("Serial link '%s' closed: %s" % (self.device, e))
+            self.close()
+            return
+        if data:
+            self.feed(data)
+
+    def send(self, msg, sender_id=0, receiver_id=0, component_id=0):
+        """Send a message over the serial link (without waiting for the output to drain)"""
+        if isinstance(msg, PprzMessage):
+            self.ser.write(self.trans.pack_pprz_msg(sender_id, msg, receiver_id, component_id))
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.remove_reader(self.ser.fileno())
+            self._loop = None
+        self.ser.close()
+        AioLink.close(self)
+
+
+class AioIvyLink(AioLink):
+    """
+    Messages of an IvyMessagesInterface delivered to the event loop
+
+    Ivy has its own threads, callbacks hand the messages over to the loop.
+    The sender_id of the delivered messages is the ac_id given by Ivy.
+    """
+    def __init__(self, ivy, **kwargs):
+        kwargs.setdefault('interface_id', None)
+        AioLink.__init__(self, **kwargs)
+        self.ivy = ivy
+        self._loop = None
+        self._bindings = []
+
+    @classmethod
+    async def create(cls, ivy, regex_or_msgs=('(.*)',), **kwargs):
+        """Subscribe to each regex or PprzMessage of regex_or_msgs on the ivy interface"""
+        link = cls(ivy, **kwargs)
+        link._loop = asyncio.get_running_loop()
+        for regex_or_msg in regex_or_msgs:
+            link._bindings.append(ivy.subscribe(link._ivy_callback, regex_or_msg))
+        return link
+
+    def _ivy_callback(self, ac_id, msg):
+        incoming = Incoming(ac_id, None, 0, msg, None)
+        try:
+            self._loop.call_soon_threadsafe(self._deliver_received, incoming)
+        except RuntimeError:
+            pass  # loop closed
+
+    def _deliver_received(self, incoming):
+        if not self.closed:
+            self.received += 1
+            self.deliver(incoming)
+
+    def send(self, msg, sender_id=None, receiver_id=None, component_id=None):
+        return self.ivy.send(msg, sender_id, receiver_id, component_id)
+
+    def close(self):
+        for bind_id in self._bindings:
+            self.ivy.unsubscribe(bind_id)
+        self._bindings = []
+        AioLink.close(self)
+
+
+def test():
+    import argparse
+    from pprzlink import messages_xml_map
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-f", "--file", help="path to messages.xml file")
+    parser.add_argument("-c", "--class", help="message class of incoming messages", dest='msg_class', default='telemetry')
+    parser.add_argument("-d", "--device", help="serial device, UDP is used if not set", dest='dev', default=None)
+    parser.add_argument("-b", "--baudrate", help="baudrate", dest='baud', default=115200, type=int)
+    parser.add_argument("--interface_id", help="interface id (sender)", dest='id', default=0, type=int)
+    parser.add_argument("-up", "--uplink_port", help="uplink port", dest='uplink', default=UPLINK_PORT, type=int)
+    parser.add_argument("-dp", "--downlink_port", help="downlink port", dest='downlink', default=DOWNLINK_PORT, type=int)
+    args = parser.parse_args()
+    messages_xml_map.parse_messages(args.file)
+
+    async def run():
+        if args.dev is None:
+            link = await AioUdpLink.create(args.uplink, args.downlink, msg_class=args.msg_class, interface_id=args.id)
+        else:
+            link = await AioSerialLink.create(args.dev, args.baud, msg_class=args.msg_class, interface_id=args.id)
+        try:
+            async for incoming in link:
+                print("new message from %i (%s): %s" % (incoming.sender_id, incoming.address, incoming.msg))
+        finally:
+            link.close()
+
+    try:
+        asyncio.run(run())
+    except (KeyboardInterrupt, SystemExit):
+        print('Shutting down...')
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,153 @@
+#
+# This file is part of PPRZLINK.
+#
+# PPRZLINK is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PPRZLINK is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PPRZLINK.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Dispatch of incoming messages to the user callbacks, off the reader threads
+
+A Dispatcher is a callable with the same signature as the callback it wraps, so it can
+replace it on any interface:
+
+    interface = SerialMessagesInterface(Dispatcher(callback, policies={'ROTORCRAFT_FP': DROP_OLDEST}), ...)
+
+Messages are queued per message type and delivered by a pool of worker threads. Messages
+of one type are delivered in order, one at a time. By default no message is dropped,
+bounded queues are an opt-in for periodic telemetry only: acks and other one-shot
+messages must never be conflated.
+"""
+
+from __future__ import absolute_import
+
+import logging
+import threading
+from collections import deque
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from pprzlink.message import PprzMessage
+
+
+logger = logging.getLogger("PprzLink")
+
+# drop policies, when the queue of a message type is full
+DROP_OLDEST = 'drop_oldest'     # newest wins: the oldest queued message is dropped
+DROP_NEWEST = 'drop_newest'     # the incoming message is dropped
+NEVER_DROP = 'never_drop'       # the queue is not bounded
+
+_STOP = object()
+
+
+class Dispatcher(object):
+    """
+    Bounded per message type queues between an interface and its callback
+
+    :param callback: user callback, called with the arguments given by the interface
+    :param workers: number of threads calling the callback
+    :param maxsize: default queue size of a message type, for a dropping policy
+    :param policy: default drop policy, NEVER_DROP unless all the messages are periodic telemetry
+    :param policies: drop policy by message name, a policy or (policy, maxsize)
+    """
+    def __init__(self, callback, workers=1, maxsize=16, policy=NEVER_DROP, policies=None):
+        self.callback = callback
+        self.maxsize = maxsize
+        self.policy = policy
+        self.policies = {}
+        for name, p in (policies or {}).items():
+            self.policies[name] = p if isinstance(p, tuple) else (p, maxsize)
+        for p, _ in list(self.policies.values()) + [(policy, maxsize)]:
+            if p not in (DROP_OLDEST, DROP_NEWEST, NEVER_DROP):
+                raise ValueError("Error: unknown drop policy '%s'" % p)
+        # counters by message name
+        self.queued = {}
+        self.dropped = {}
+        self.delivered = {}
+        self._queues = {}           # message name -> (deque of callback args, policy, maxsize)
+        self._scheduled = set()     # names with messages queued on _ready or being delivered
+        self._ready = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._work, name='dispatcher %i' % i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def __call__(self, *args):
+        msg = None
+        for arg in args:
+            if isinstance(arg, PprzMessage):
+                msg = arg
+                break
+        name = msg.name if msg is not None else None
+        with self._lock:
+            entry = self._queues.get(name)
+            if entry is None:
+                policy, maxsize = self.policies.get(name, (self.policy, self.maxsize))
+                entry = self._queues[name] = (deque(), policy, maxsize)
+                self.queued[name] = self.dropped[name] = self.delivered[name] = 0
+            pending, policy, maxsize = entry
+            if policy != NEVER_DROP and len(pending) >= maxsize:
+                self.dropped[name] += 1
+                if policy == DROP_NEWEST:
+                    return
+                pending.popleft()
+            pending.append(args)
+            self.queued[name] += 1
+            if name not in self._scheduled:
+                self._scheduled.add(name)
+                self._ready.put(name)
+
+    def _work(self):
+        while True:
+            name = self._ready.get()
+            if name is _STOP:
+                return
+            with self._lock:
+                pending = self._queues[name][0]
+                args = pending.popleft()
+            try:
+                self.callback(*args)
+            except Exception:
+                logger.exception("Error in callback for message %s" % name)
+            with self._lock:
+                self.delivered[name] += 1
+                # one message at a time per type, other types get a turn in between
+                if pending:
+                    self._ready.put(name)
+                else:
+                    self._scheduled.discard(name)
+
+    def pending(self):
+        """Number of messages waiting to be delivered, by message name"""
+        with self._lock:
+            return dict((name, len(entry[0])) for name, entry in self._queues.items())
+
+    def stats(self):
+        """Counters by message name: queued, dropped, delivered and pending messages"""
+        with self._lock:
+            return dict((name, {'queued': self.queued[name], 'dropped': self.dropped[name],
+                                'delivered': self.delivered[name], 'pending': len(entry[0])})
+                        for name, entry in self._queues.items())
+
+    def stop(self, timeout=None):
+        """Stop the workers, messages still queued may not be delivered"""
+        for _ in self._workers:
+            self._ready.put(_STOP)
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
@@ -24,7 +24,7 @@ import os
 import re
 import platform
 
-from pprzlink.message import PprzMessage
+from pprzlink.message import PprzMessage, PprzMessageError
 from pprzlink import messages_xml_map
 from pprzlink.request_uid import RequestUIDFactory
 
@@ -38,26 +38,42 @@ else:
 
 logger = logging.getLogger("PprzLink")
 
+# normal format is "sender_name msg_name msg_payload..."
+IVY_MSG_RE = re.compile(r"(\S+) +(\S+) +(.*)")
+# advanced format has a request_id ('pid_index') as first or second string
+IVY_REQUEST_ID_RE = re.compile(r"[0-9]+_[0-9]+")
+IVY_ADVANCED_RE = re.compile(r"(\S+)+( .*|$)")
+
 
 class IvyMessagesInterface(object):
     """
     This class is the interface between the paparazzi messages and the Ivy bus.
     """
-    def __init__(self, agent_name=None, start_ivy=True, verbose=False, ivy_bus=IVY_BUS):
+    def __init__(self, agent_name=None, start_ivy=True, verbose=False, ivy_bus=IVY_BUS, typed=False,
+                 numpy_arrays=False):
+        """
+        :param typed: decode numeric fields of incoming messages to int/float instead of strings,
+                      messages with values that do not convert are ignored
+        :param numpy_arrays: with typed, decode numeric array fields to NumPy arrays
+        """
         if agent_name is None:
             agent_name = "IvyMessagesInterface %i" % os.getpid()
         self.agent_name = agent_name
         self.verbose = verbose
+        self.typed = typed
+        self.numpy_arrays = numpy_arrays
         self._ivy_bus = ivy_bus
         self._running = False
 
-        # make sure all messages are parsed before we start creating them in callbacks
-        # the message parsing should really be redone...
-        messages_xml_map.parse_messages()
+        # message definitions are loaded on first use (from the compiled cache when available),
+        # loading is protected against concurrent callbacks
 
         # bindings with associated callback functions
         self.bindings = {}
 
+        # FlightRecorder of the subscribed messages, re-encoded as binary frames
+        self.recorder = None
+
         IvyInit(agent_name, "READY")
         logging.getLogger('Ivy').setLevel(logging.WARN)
         if start_ivy:
@@ -120,11 +136,19 @@ class IvyMessagesInterface(object):
             regex = '^([^ ]* +%s( .*|$))' % (regex_or_msg.name)
 
         def _parse_and_call_callback(agent, *larg):
-            params = self.parse_pprz_msg(larg[0])
+            params = self.parse_pprz_msg(larg[0], self.typed, self.numpy_arrays)
             if not params:
                 return
             ac_id, _, msg = params
-            callback(ac_id, msg)
+            try:
+                callback(ac_id, msg)
+            finally:
+                if self.recorder is not None:
+                    # recording never gets in the way of the callbacks
+                    try:
+                        self.recorder.record_message(ac_id, msg)
+                    except Exception:
+                        logger.exception("Error while recording message %s" % msg.name)
 
         return self.bind_raw(
             callback=_parse_and_call_callback,
@@ -143,7 +167,7 @@ class IvyMessagesInterface(object):
         """
         regex = r'^(\S*\s+\S*\s+%s_REQ.*)' % request_name
         def _callback_wrapper(_, *larg):
-            params = self.parse_pprz_msg(larg[0])
+            params = self.parse_pprz_msg(larg[0], self.typed, self.numpy_arrays)
             if not params:
                 return
             ac_id, request_id, msg = params
@@ -166,11 +190,13 @@ class IvyMessagesInterface(object):
         self.unbind(bind_id)
 
     @staticmethod
-    def parse_pprz_msg(ivy_msg):
+    def parse_pprz_msg(ivy_msg, typed=False, numpy_arrays=False):
         """
         Parse an Ivy message into a PprzMessage.
 
         :param ivy_msg: Ivy message string to parse into PprzMessage
+        :param typed: convert numeric fields to int/float according to their type
+        :param numpy_arrays: with typed, convert numeric array fields to NumPy arrays
         :return ac_id, request_id, msg: The parameters to be passed to callback
         """
         # normal format is "sender_name msg_name msg_payload..."
@@ -178,27 +204,34 @@ class IvyMessagesInterface(object):
         # request: "sender_name request_id msg_name_REQ msg_payload..."
         # answer:  "request_id sender_name msg_name msg_payload..."
 
-        data = re.search("(\S+) +(\S+) +(.*)", ivy_msg)
-        # check for request_id in first or second string (-> advanced format with msg_name in third string)
-        if data is None:
-            return
-        if re.search("[0-9]+_[0-9]+", data.group(1)) or re.search("[0-9]+_[0-9]+", data.group(2)):
-            if re.search("[0-9]+_[0-9]+", data.group(1)):
-                sender_name = data.group(2)
-                request_id = data.group(1)
+        parts = ivy_msg.split(' ', 2)
+        if (len(parts) == 3 and parts[0] and parts[1] and
+                IVY_REQUEST_ID_RE.search(parts[0]) is None and IVY_REQUEST_ID_RE.search(parts[1]) is None):
+            # fast path, this is a normal message
+            sender_name, msg_name, payload = parts
+            request_id = None
+        else:
+            data = IVY_MSG_RE.search(ivy_msg)
+            # check for request_id in first or second string (-> advanced format with msg_name in third string)
+            if data is None:
+                return
+            if IVY_REQUEST_ID_RE.search(data.group(1)) or IVY_REQUEST_ID_RE.search(data.group(2)):
+                if IVY_REQUEST_ID_RE.search(data.group(1)):
+                    sender_name = data.group(2)
+                    request_id = data.group(1)
+                else:
+                    sender_name = data.group(1)
+                    request_id = data.group(2)
+                # this is an advanced type, split again
+                data = IVY_ADVANCED_RE.search(data.group(3))
+                msg_name = data.group(1)
+                payload = data.group(2)
             else:
+                # this was a normal message
                 sender_name = data.group(1)
-                request_id = data.group(2)
-            # this is an advanced type, split again
-            data = re.search("(\S+)+( .*|$)", data.group(3))
-            msg_name = data.group(1)
-            payload = data.group(2)
-        else:
-            # this was a normal message
-            sender_name = data.group(1)
-            msg_name = data.group(2)
-            payload = data.group(3)
-            request_id = None
+                msg_name = data.group(2)
+                payload = data.group(3)
+                request_id = None
         # check which message class it is
         try:
             msg_class, msg_name = messages_xml_map.find_msg_by_name(msg_name)
@@ -207,7 +240,12 @@ class IvyMessagesInterface(object):
             return
 
         msg = PprzMessage(msg_class, msg_name)
-        msg.ivy_string_to_payload(payload)
+        try:
+            msg.ivy_string_to_payload(payload, typed, numpy_arrays)
+        except PprzMessageError as e:
+            # typed values that don't convert, the callbacks only get numbers
+            logger.warning("Ignoring message %s, %s" % (ivy_msg, e))
+            return
         # pass non-telemetry messages with ac_id 0 or ac_id attrib value
         if msg_class == "telemetry":
             try:
@@ -219,8 +257,8 @@ class IvyMessagesInterface(object):
                 logger.warning("ignoring message " + ivy_msg)
                 return None
         else:
-            if 'ac_id' in msg.fieldnames:
-                ac_id_idx = msg.fieldnames.index('ac_id')
+            ac_id_idx = msg.descriptor.fieldindex.get('ac_id')
+            if ac_id_idx is not None:
                 ac_id = msg.fieldvalues[ac_id_idx]
             else:
                 ac_id = 0
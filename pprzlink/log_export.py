@@ -0,0 +1,282 @@
+#
+# This file is part of PPRZLINK.
+#
+# PPRZLINK is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PPRZLINK is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PPRZLINK.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Columnar export of the frames of a flight log, one table per message type
+
+Frames are decoded with NumPy, all the frames of a message type at once: the payloads
+are viewed as a structured array built from the field types of messages_xml_map.
+Messages with variable length arrays are decoded by groups of frames having the same
+array lengths, these arrays are padded to the longest one and get a `<field>_length` column.
+
+Each table is a structured array with `_timestamp`, `_sender_id`, `_receiver_id`,
+`_component_id` and one column per field, in log order. The `_index` table gives the
+table (`class_id`, `msg_id`) and row of every frame of the log, in log order.
+
+    python -m pprzlink.log_export logs/flight1 flight1.npz
+    python -m pprzlink.log_export logs/flight1 flight1_parquet -o parquet   # with pyarrow
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import os
+
+import numpy as np
+
+from pprzlink.message import get_msg_descriptor, PprzMessageError, VARIABLE_LENGTH
+from pprzlink.recorder import FlightLog, REC_FRAME
+
+
+logger = logging.getLogger("PprzLink")
+
+# NumPy types of the binary formats of message.BIN_TYPES
+NUMPY_TYPES = {
+    'f': '<f4',
+    'd': '<f8',
+    'B': 'u1',
+    'H': '<u2',
+    'L': '<u4',
+    'b': 'i1',
+    'h': '<i2',
+    'l': '<i4',
+    'c': 'S1'
+}
+
+INDEX_DTYPE = np.dtype([('timestamp', '<f8'), ('class_id', 'u1'), ('msg_id', 'u1'), ('row', '<i8')])
+# header columns start with '_', message fields may have the same names
+HEADER_DTYPE = np.dtype([('_timestamp', '<f8'), ('_sender_id', 'u1'), ('_receiver_id', 'u1'), ('_component_id', 'u1')])
+
+
+def _payload_dtype(desc, lengths=()):
+    """Structured dtype of a payload, for the given lengths of its variable arrays"""
+    fields = []
+    var_idx = 0
+    for name, (code, _, length) in zip(desc.fieldnames, desc.codec.fields):
+        if length is None:
+            fields.append((name, NUMPY_TYPES[code]))
+            continue
+        if length == VARIABLE_LENGTH:
+            fields.append((name + '_length', 'u1'))
+            length = lengths[var_idx]
+            var_idx += 1
+        fields.append((name, NUMPY_TYPES[code], (length,)))
+    return np.dtype(fields)
+
+
+def _array_lengths(desc, payloads, sizes):
+    """Lengths of the variable arrays of each payload (N, nb arrays) and mask of the well formed ones"""
+    rows = np.arange(len(payloads))
+    pos = np.zeros(len(payloads), dtype=np.int64)
+    lengths = []
+    for code, size, length in desc.codec.fields:
+        if length is None:
+            pos += size
+        elif length != VARIABLE_LENGTH:
+            pos += size * length
+        else:
+            array_length = payloads[rows, np.minimum(pos, payloads.shape[1] - 1)].astype(np.int64)
+            lengths.append(array_length)
+            pos += 1 + size * array_length
+    return np.stack(lengths, axis=1), pos == sizes
+
+
+def _decode(desc, payloads, lengths=()):
+    dtype = _payload_dtype(desc, lengths)
+    if dtype.itemsize == 0:
+        # message without fields
+        return np.zeros(len(payloads), dtype=dtype)
+    return np.ascontiguousarray(payloads[:, :dtype.itemsize]).view(dtype).ravel()
+
+
+def _header(records, rows):
+    header = np.zeros(len(rows), dtype=HEADER_DTYPE)
+    header['_timestamp'] = records['timestamp'][rows]
+    data = records['data'][rows, :3]
+    header['_sender_id'] = data[:, 0]
+    header['_receiver_id'] = data[:, 1]
+    header['_component_id'] = data[:, 2] >> 4
+    return header
+
+
+def decode_frames(records, offset=0, chunks=None):
+    """
+    Decode REC_FRAME records (structured array of recorder.record_dtype) by message type
+
+    :param offset: position of the first record in the log, when decoding a log segment by segment
+    :param chunks: dict the decoded chunks are added to
+    :return: dict (class_id, msg_id) -> list of (frame positions, header arrays, decoded payload arrays)
+    """
+    if chunks is None:
+        chunks = {}
+    data = records['data']
+    sizes = records['length'].astype(np.int64) - 4
+    class_ids = data[:, 2] & 0x0F
+    keys = class_ids.astype(np.int64) * 256 + data[:, 3]
+    for key in np.unique(keys):
+        class_id, msg_id = divmod(int(key), 256)
+        try:
+            desc = get_msg_descriptor(class_id, msg_id)
+            desc.codec
+        except (ValueError, KeyError, PprzMessageError) as e:
+            logger.warning("Ignoring unknown message, %s" % e)
+            continue
+        rows = np.flatnonzero(keys == key)
+        payloads = data[rows, 4:]
+        if desc.codec.struct is not None:
+            valid = sizes[rows] == desc.codec.struct.size
+            groups = [((), valid)]
+        else:
+            lengths, valid = _array_lengths(desc, payloads, sizes[rows])
+            unique, inverse = np.unique(lengths, axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            groups = [(tuple(int(l) for l in group), valid & (inverse == i)) for i, group in enumerate(unique)]
+        if not valid.all():
+            logger.warning("Ignoring %d malformed %s frames" % (np.count_nonzero(~valid), desc.name))
+        for lengths, mask in groups:
+            if mask.any():
+                chunks.setdefault((class_id, msg_id), []).append(
+                    (rows[mask] + offset, _header(records, rows[mask]), _decode(desc, payloads[mask], lengths)))
+    return chunks
+
+
+def _merge(desc, chunks):
+    """Build the table of a message type from its decoded chunks, in log order"""
+    positions = np.concatenate([p for p, _, _ in chunks])
+    columns = [(name, HEADER_DTYPE[name].str, None) for name in HEADER_DTYPE.names]
+    for name, (code, _, length) in zip(desc.fieldnames, desc.codec.fields):
+        if length == VARIABLE_LENGTH:
+            columns.append((name + '_length', 'u1', None))
+            length = max(c.dtype[name].shape[0] for _, _, c in chunks)
+        if code == 'c' and length is not None:
+            columns.append((name, 'S%d' % max(length, 1), None))
+        else:
+            columns.append((name, NUMPY_TYPES[code], (length,) if length is not None else None))
+    table = np.zeros(len(positions), dtype=[c if c[2] is not None else c[:2] for c in columns])
+    start = 0
+    for _, header, chunk in chunks:
+        stop = start + len(chunk)
+        for name in HEADER_DTYPE.names:
+            table[name][start:stop] = header[name]
+        for name in chunk.dtype.names:
+            values = chunk[name]
+            if values.ndim == 1:
+                table[name][start:stop] = values
+            elif values.dtype.kind == 'S':
+                # char arrays as byte strings
+                if values.shape[1]:
+                    table[name][start:stop] = np.ascontiguousarray(values).view('S%d' % values.shape[1]).ravel()
+            else:
+                table[name][start:stop, :values.shape[1]] = values
+        start = stop
+    order = np.argsort(positions, kind='stable')
+    return table[order], positions[order]
+
+
+def load_tables(log_dir, prefix='flight'):
+    """
+    Decode all the frames of a flight log
+
+    :return: dict of tables by '<class>.<message name>', index table
+    """
+    log = FlightLog(log_dir, prefix)
+    # segments are decoded one by one, only the frames of one segment are copied from the mapping at a time
+    chunks = {}
+    timestamps = []
+    frames = 0
+    for path in log.segments():
+        records = log.segment_array(path)
+        records = records[records['kind'] == REC_FRAME]
+        decode_frames(records, frames, chunks)
+        timestamps.append(np.array(records['timestamp']))
+        frames += len(records)
+        del records
+    tables = {}
+    index = np.zeros(frames, dtype=INDEX_DTYPE)
+    if timestamps:
+        index['timestamp'] = np.concatenate(timestamps)
+    index['row'] = -1
+    for (class_id, msg_id), message_chunks in sorted(chunks.items()):
+        desc = get_msg_descriptor(class_id, msg_id)
+        table, positions = _merge(desc, message_chunks)
+        tables['%s.%s' % (desc.class_name, desc.name)] = table
+        index['class_id'][positions] = class_id
+        index['msg_id'][positions] = msg_id
+        index['row'][positions] = np.arange(len(positions))
+    return tables, index[index['row'] >= 0]
+
+
+def save_npz(path, tables, index):
+    np.savez(path, _index=index, **tables)
+
+
+def _arrow_table(table):
+    import pyarrow as pa
+    arrays = []
+    for name in table.dtype.names:
+        column = table[name]
+        if column.ndim > 1:
+            width = column.shape[1]
+            flat = pa.array(np.ascontiguousarray(column).ravel())
+            arrays.append(pa.FixedSizeListArray.from_arrays(flat, width))
+        else:
+            arrays.append(pa.array(column))
+    return pa.Table.from_arrays(arrays, names=list(table.dtype.names))
+
+
+def save_parquet(directory, tables, index):
+    """One parquet file per table in directory, needs pyarrow"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Error: pyarrow is needed for the parquet export")
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    pq.write_table(_arrow_table(index), os.path.join(directory, '_index.parquet'))
+    for name, table in tables.items():
+        pq.write_table(_arrow_table(table), os.path.join(directory, name + '.parquet'))
+
+
+def export_log(log_dir, output, output_format='npz', prefix='flight'):
+    tables, index = load_tables(log_dir, prefix)
+    if output_format == 'parquet':
+        save_parquet(output, tables, index)
+    else:
+        save_npz(output, tables, index)
+    return tables, index
+
+
+def test():
+    import argparse
+    import time
+    from pprzlink import messages_xml_map
+
+    parser = argparse.ArgumentParser(description="Export the frames of a flight log to one table per message type")
+    parser.add_argument("log_dir", help="flight log directory")
+    parser.add_argument("output", help="npz file, or directory of parquet files")
+    parser.add_argument("-f", "--file", help="path to messages.xml file")
+    parser.add_argument("-o", "--format", help="output format", dest='output_format', default='npz',
+                        choices=['npz', 'parquet'])
+    args = parser.parse_args()
+    messages_xml_map.parse_messages(args.file)
+    start = time.monotonic()
+    tables, index = export_log(args.log_dir, args.output, args.output_format)
+    print("%i frames of %i message types exported in %.2f s" % (len(index), len(tables), time.monotonic() - start))
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,109 @@
+#
+# This file is part of PPRZLINK.
+#
+# PPRZLINK is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PPRZLINK is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PPRZLINK.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Latest value mailbox: the newest message of each aircraft and message type
+
+A Mailbox can be given as callback to any interface, a new message overwrites the
+previous one of the same aircraft and type. Consumers poll it at their own rate
+(typically from a control loop) and never see stale samples.
+
+Each entry is replaced by a single dictionary assignment of an immutable (timestamp, msg, seq)
+tuple, so readers don't need any lock to get a consistent sample. The sequence number seq
+increases with every put, consumers poll the new samples with updates() and the last
+sequence number they got, which does not miss samples stored by concurrent writers.
+"""
+
+from __future__ import absolute_import
+
+import threading
+import time
+
+from pprzlink.message import PprzMessage
+
+
+class Mailbox(object):
+    """Newest message and its reception time (time.monotonic) by (ac_id, message name)"""
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._latest = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.received = 0
+
+    def __call__(self, ac_id, *args):
+        """Callback of the interfaces: the first argument is the aircraft id, the message follows"""
+        for arg in args:
+            if isinstance(arg, PprzMessage):
+                self.put(ac_id, arg)
+                return
+
+    def __len__(self):
+        return len(self._latest)
+
+    def __contains__(self, key):
+        return key in self._latest
+
+    def put(self, ac_id, msg, timestamp=None):
+        with self._lock:
+            self._seq += 1
+            self._latest[(ac_id, msg.name)] = (self._clock() if timestamp is None else timestamp, msg, self._seq)
+            self.received += 1
+
+    def get_sample(self, ac_id, name):
+        """(timestamp, message) of the newest message, None if none was received"""
+        sample = self._latest.get((ac_id, name))
+        return sample[:2] if sample is not None else None
+
+    def get(self, ac_id, name, max_age=None):
+        """Newest message, None if none was received or if older than max_age (s)"""
+        sample = self._latest.get((ac_id, name))
+        if sample is None or (max_age is not None and self._clock() - sample[0] > max_age):
+            return None
+        return sample[1]
+
+    def updates(self, seq=0, name=None):
+        """
+        Samples stored after sequence number seq, for all or one message name
+
+        :return: last sequence number, to give to the next call, and list of (ac_id, name, timestamp, msg)
+        """
+        with self._lock:
+            last = self._seq
+            items = list(self._latest.items())
+        return last, [(key[0], key[1], sample[0], sample[1]) for key, sample in items
+                      if sample[2] > seq and (name is None or key[1] == name)]
+
+    def updated_since(self, timestamp, name=None):
+        """
+        List of (ac_id, name, timestamp, msg) received after timestamp, for all or one message name
+
+        With several writer threads, use updates() to poll the new samples, a sample can be
+        stored after a newer one.
+        """
+        # list() copies the items at once, puts from other threads may go on
+        return [(key[0], key[1], sample[0], sample[1]) for key, sample in list(self._latest.items())
+                if sample[0] > timestamp and (name is None or key[1] == name)]
+
+    def remove(self, ac_id, name=None):
+        """Forget the messages of an aircraft, all or only one message name"""
+        for key in list(self._latest):
+            if key[0] == ac_id and (name is None or key[1] == name):
+                self._latest.pop(key, None)
+
+    def clear(self):
+        self._latest.clear()
@@ -27,6 +27,48 @@ import struct
 import re
 from pprzlink import messages_xml_map
 
+# binary format and size of each base type
+BIN_TYPES = {
+    'float': ('f', 4),
+    'double': ('d', 8),
+    'uint8': ('B', 1),
+    'uint16': ('H', 2),
+    'uint32': ('L', 4),
+    'int8': ('b', 1),
+    'int16': ('h', 2),
+    'int32': ('l', 4),
+    'char': ('c', 1)
+}
+
+# array length of variable length array fields in a codec layout
+VARIABLE_LENGTH = -1
+
+# conversion of Ivy strings to Python numbers, other types (char, string) are kept as strings
+IVY_CONVERTERS = {
+    'float': float,
+    'double': float,
+    'uint8': int,
+    'uint16': int,
+    'uint32': int,
+    'int8': int,
+    'int16': int,
+    'int32': int
+}
+
+def _keep_value(value):
+    return value
+
+
+# NumPy types of numeric array fields decoded from Ivy (same as the Python numbers)
+NUMPY_DTYPES = {
+    float: 'float64',
+    int: 'int64'
+}
+
+
+# char arrays in Ivy strings: ``|f,o,o, ,b,a,r|`` in old format or ``"foo bar"`` in new format
+IVY_STRING_RE = re.compile('([|\"][^|\"]*[|\"])')
+
 
 class PprzMessageError(Exception):
     def __init__(self, message, inner_exception=None):
@@ -38,66 +80,321 @@ class PprzMessageError(Exception):
         return self.message
 
 
-class PprzMessage(object):
-    """base Paparazzi message class"""
-
-    def __init__(self, class_name, msg, component_id=0):
+def _to_char(c):
+    if isinstance(c, bytes):
+        return c
+    return c.encode()
+
+
+# conversion applied to field values when they don't have the right type for packing
+_BIN_CONVERTERS = {
+    'f': float,
+    'd': float,
+    'B': int,
+    'H': int,
+    'L': int,
+    'b': int,
+    'h': int,
+    'l': int,
+    'c': _to_char
+}
+
+
+class PprzMessageCodec(object):
+    """
+    Binary layout of a message type, compiled once from its field types
+
+    Messages without variable length arrays are encoded and decoded with a single struct.Struct.
+    For the other ones, the format only depends on the length of the variable arrays,
+    so one struct.Struct is built and cached per combination of lengths.
+    """
+
+    def __init__(self, fieldtypes):
+        # list of (format char, size, array length) with None length for scalars
+        self.fields = []
+        for t in fieldtypes:
+            base_type, _, array = t.partition('[')
+            if base_type not in BIN_TYPES:
+                raise PprzMessageError("Error: type %s has no binary format" % t)
+            code, size = BIN_TYPES[base_type]
+            if not array:
+                length = None
+            elif array == ']':
+                length = VARIABLE_LENGTH
+            else:
+                length = int(array[:-1])
+            self.fields.append((code, size, length))
+        # for each variable array: format char, element size and number of bytes to skip before its length byte
+        self._variable_arrays = []
+        gap = 0
+        for code, size, length in self.fields:
+            if length == VARIABLE_LENGTH:
+                self._variable_arrays.append((code, size, gap))
+                gap = 0
+            elif length is None:
+                gap += size
+            else:
+                gap += size * length
+        self._layouts = {}
+        if not self._variable_arrays:
+            self.struct, self._plan = self._layout(())
+        else:
+            self.struct = None
+
+    def _layout(self, lengths):
+        """Build the Struct and the field slices for the given lengths of variable arrays"""
+        layout = self._layouts.get(lengths)
+        if layout is not None:
+            return layout
+        fmt = '<'
+        plan = []
+        flat_idx = 0
+        var_idx = 0
+        for code, _, length in self.fields:
+            if length is None:
+                fmt += code
+                plan.append((flat_idx, None))
+                flat_idx += 1
+                continue
+            if length == VARIABLE_LENGTH:
+                length = lengths[var_idx]
+                var_idx += 1
+                # length byte
+                fmt += 'B'
+                flat_idx += 1
+            fmt += '%d%s' % (length, code)
+            plan.append((flat_idx, flat_idx + length))
+            flat_idx += length
+        layout = (struct.Struct(fmt), plan)
+        self._layouts[lengths] = layout
+        return layout
+
+    def _flatten(self, values, convert):
+        flat = []
+        for (code, _, length), value in zip(self.fields, values):
+            if length is None:
+                flat.append(_BIN_CONVERTERS[code](value) if convert else value)
+                continue
+            if convert:
+                value = [_BIN_CONVERTERS[code](x) for x in value]
+            if length == VARIABLE_LENGTH:
+                flat.append(len(value))
+            elif convert and len(value) != length:
+                # pad or truncate fixed arrays to their declared length
+                value = (list(value) + [_BIN_CONVERTERS[code](0)] * length)[:length]
+            flat.extend(value)
+        return flat
+
+    def pack(self, values):
+        """Encode a list of field values"""
+        if self.struct is not None:
+            packer = self.struct
+        else:
+            lengths = tuple(len(values[i]) for i, (_, _, length) in enumerate(self.fields)
+                            if length == VARIABLE_LENGTH)
+            packer = self._layout(lengths)[0]
+        try:
+            return packer.pack(*self._flatten(values, False))
+        except struct.error:
+            # values are not of the right type (strings from Ivy for instance), convert them
+            return packer.pack(*self._flatten(values, True))
+
+    def unpack(self, data, offset=0):
+        """Decode the payload in data starting at offset, return the list of field values"""
+        if self.struct is not None:
+            unpacker, plan = self.struct, self._plan
+        else:
+            lengths = []
+            pos = offset
+            for _, size, gap in self._variable_arrays:
+                pos += gap
+                length = data[pos]
+                lengths.append(length)
+                pos += 1 + size * length
+            unpacker, plan = self._layout(tuple(lengths))
+        flat = unpacker.unpack_from(data, offset)
+        return [flat[start] if stop is None else list(flat[start:stop]) for start, stop in plan]
+
+
+class PprzMessageDescriptor(object):
+    """
+    Definition of a message type, resolved once from messages_xml_map
+
+    Descriptors are interned: all the messages of a type share the same descriptor,
+    they should be considered immutable.
+    """
+
+    __slots__ = ('class_name', 'class_id', 'name', 'msg_id', 'fieldnames', 'fieldtypes', 'fieldcoefs',
+                 'fieldindex', 'broadcasted', 'defaults', 'array_fields', 'ivy_converters',
+                 '_ivy_scalar_converters', '_codec')
+
+    def __init__(self, class_name, msg):
         if isinstance(class_name, int):
             # class_name is an integer, find the name
-            # TODO handle None case
-            self._class_id = class_name
-            self._class_name = messages_xml_map.get_class_name(self._class_id)
+            self.class_id = class_name
+            self.class_name = messages_xml_map.get_class_name(class_name)
         else:
-            self._class_name = class_name
-            self._class_id = messages_xml_map.get_class_id(class_name)
-        self._component_id = component_id
+            self.class_name = class_name
+            self.class_id = messages_xml_map.get_class_id(class_name)
         if isinstance(msg, int):
-            self._id = msg
-            self._name = messages_xml_map.get_msg_name(self._class_name, msg)
+            self.msg_id = msg
+            self.name = messages_xml_map.get_msg_name(self.class_name, msg)
         else:
-            self._name = msg
-            self._id = messages_xml_map.get_msg_id(self._class_name, msg)
-        self._fieldnames = messages_xml_map.get_msg_fields(self._class_name, self._name)
-        self._fieldtypes = messages_xml_map.get_msg_fieldtypes(self._class_name, self._id)
-        self._fieldcoefs = messages_xml_map.get_msg_fieldcoefs(self._class_name, self._id)
-        self._fieldvalues = []
-        # set empty values according to type
-        for t in self._fieldtypes:
+            self.name = msg
+            self.msg_id = messages_xml_map.get_msg_id(self.class_name, msg)
+        self.fieldnames = messages_xml_map.get_msg_fields(self.class_name, self.name)
+        self.fieldtypes = messages_xml_map.get_msg_fieldtypes(self.class_name, self.msg_id)
+        self.fieldcoefs = messages_xml_map.get_msg_fieldcoefs(self.class_name, self.msg_id)
+        self.fieldindex = messages_xml_map.get_msg_field_index(self.class_name, self.msg_id)
+        # empty values according to type, arrays need a new list for each message
+        defaults = []
+        array_fields = []
+        for idx, t in enumerate(self.fieldtypes):
             if t == "char[]":
-                self._fieldvalues.append('')
+                defaults.append('')
             elif '[' in t:
-                self._fieldvalues.append([0])
+                defaults.append(None)
+                array_fields.append(idx)
+            else:
+                defaults.append(0)
+        self.defaults = tuple(defaults)
+        self.array_fields = tuple(array_fields)
+        # (conversion function, is array) for each field, None for fields kept as strings
+        ivy_converters = []
+        for t in self.fieldtypes:
+            base_type, _, array = t.partition('[')
+            if base_type in IVY_CONVERTERS:
+                ivy_converters.append((IVY_CONVERTERS[base_type], bool(array)))
             else:
-                self._fieldvalues.append(0)
-        if messages_xml_map.message_dictionary_broadcast[self._name]=='forwarded':
-            self.broadcasted = False
+                ivy_converters.append(None)
+        self.ivy_converters = tuple(ivy_converters)
+        # single pass conversion for messages without numeric arrays
+        if all(c is None or not c[1] for c in ivy_converters):
+            self._ivy_scalar_converters = tuple(_keep_value if c is None else c[0] for c in ivy_converters)
         else:
-            self.broadcasted = True
+            self._ivy_scalar_converters = None
+        self.broadcasted = messages_xml_map.message_dictionary_broadcast[self.name] != 'forwarded'
+        self._codec = None
+
+    def new_values(self):
+        """Get a new list of empty field values"""
+        values = list(self.defaults)
+        for idx in self.array_fields:
+            values[idx] = [0]
+        return values
+
+    def convert_ivy_values(self, values, numpy_arrays=False):
+        """
+        Convert the string values parsed from Ivy to numbers
+
+        :param numpy_arrays: return numeric arrays as NumPy arrays instead of lists
+        :raises PprzMessageError: if a numeric field doesn't convert, callbacks of typed interfaces
+                                  can rely on getting numbers
+        """
+        if self._ivy_scalar_converters is not None:
+            try:
+                return [conv(value) for conv, value in zip(self._ivy_scalar_converters, values)]
+            except (ValueError, TypeError):
+                pass
+        typed = []
+        for name, converter, value in zip(self.fieldnames, self.ivy_converters, values):
+            if converter is not None:
+                conv, is_array = converter
+                try:
+                    if not is_array:
+                        value = conv(value)
+                    else:
+                        if not isinstance(value, list):
+                            # single element array
+                            value = [value]
+                        if numpy_arrays:
+                            import numpy as np
+                            value = np.array(value, dtype=NUMPY_DTYPES[conv])
+                        else:
+                            value = [conv(x) for x in value]
+                except (ValueError, TypeError):
+                    raise PprzMessageError("Error: invalid value '%s' for field %s of message %s"
+                                           % (value, name, self.name))
+            typed.append(value)
+        return typed
+
+    @property
+    def codec(self):
+        """Get the binary codec, compiled on first use"""
+        if self._codec is None:
+            self._codec = PprzMessageCodec(self.fieldtypes)
+        return self._codec
+
+
+_descriptors = messages_xml_map.register_cache({})
+
+
+def get_msg_descriptor(msg_class, msg):
+    """
+    Get the interned descriptor of a message
+
+    :param msg_class: class name or id
+    :param msg: message name or id
+    """
+    try:
+        return _descriptors[(msg_class, msg)]
+    except KeyError:
+        pass
+    desc = PprzMessageDescriptor(msg_class, msg)
+    # one descriptor per message type, whatever the names or ids used to get it
+    desc = _descriptors.setdefault((desc.class_name, desc.msg_id), desc)
+    _descriptors[(msg_class, msg)] = desc
+    return desc
+
+
+def get_msg_codec(msg_class, msg_id):
+    """Get the (cached) binary codec of a message"""
+    return get_msg_descriptor(msg_class, msg_id).codec
+
+
+class PprzMessage(object):
+    """base Paparazzi message class"""
+
+    __slots__ = ('_desc', '_component_id', '_fieldvalues')
+
+    def __init__(self, class_name, msg, component_id=0):
+        self._desc = get_msg_descriptor(class_name, msg)
+        self._component_id = component_id
+        self._fieldvalues = self._desc.new_values()
+
+    @property
+    def descriptor(self):
+        """Get the shared message type descriptor."""
+        return self._desc
+
+    @property
+    def broadcasted(self):
+        return self._desc.broadcasted
 
     @property
     def name(self):
         """Get the message name."""
-        return self._name
+        return self._desc.name
 
     @property
     def msg_id(self):
         """Get the message id."""
-        return self._id
+        return self._desc.msg_id
 
     @property
     def class_id(self):
         """Get the class id."""
-        return self._class_id
+        return self._desc.class_id
 
     @property
     def msg_class(self):
         """Get the message class."""
-        return self._class_name
+        return self._desc.class_name
 
     @property
     def fieldnames(self):
         """Get list of field names."""
-        return self._fieldnames
+        return self._desc.fieldnames
 
     @property
     def fieldvalues(self):
@@ -107,28 +404,17 @@ class PprzMessage(object):
     @property
     def fieldtypes(self):
         """Get list of field types."""
-        return self._fieldtypes
+        return self._desc.fieldtypes
 
     @property
     def fieldcoefs(self):
         """Get list of field coefs."""
-        return self._fieldcoefs
+        return self._desc.fieldcoefs
 
     def fieldbintypes(self, t):
         """Get type and length for binary format"""
-        data_types = {
-            'float': ['f', 4],
-            'double': ['d', 8],
-            'uint8': ['B', 1],
-            'uint16': ['H', 2],
-            'uint32': ['L', 4],
-            'int8': ['b', 1],
-            'int16': ['h', 2],
-            'int32': ['l', 4],
-            'char': ['c', 1]
-        }
         base_type = t.split('[')[0]
-        return data_types[base_type]
+        return BIN_TYPES[base_type]
 
     def get_field(self, idx):
         """Get field value by index."""
@@ -136,17 +422,19 @@ class PprzMessage(object):
 
     def __getattr__(self, attr):
         # Try to dynamically return the field value for the given name
-        for idx, f in enumerate(self.fieldnames):
-            if f == attr:
-                return self.fieldvalues[idx]
+        # (private names are slots, don't look them up while the message is being built)
+        if not attr.startswith('_'):
+            idx = self._desc.fieldindex.get(attr)
+            if idx is not None:
+                return self._fieldvalues[idx]
         raise AttributeError("No such attribute %s" % attr)
 
     def __getitem__(self, key):
         # Try to dynamically return the field value for the given name
-        for idx, f in enumerate(self.fieldnames):
-            if f == key:
-                return self.fieldvalues[idx]
-        raise AttributeError("Msg %s has no field of name %s" % (self.name, key))
+        idx = self._desc.fieldindex.get(key)
+        if idx is None:
+            raise AttributeError("Msg %s has no field of name %s" % (self.name, key))
+        return self._fieldvalues[idx]
 
     def __setitem__(self, key, value):
         self.set_value_by_name(key, value)
@@ -161,11 +449,10 @@ class PprzMessage(object):
 
     def set_value_by_name(self, name, value):
         # Try to set a value from its name
-        for idx, f in enumerate(self.fieldnames):
-            if f == name:
-                self._fieldvalues[idx] = value
-                return
-        raise AttributeError("Msg %s has no field of name %s" % (self.name, name))
+        idx = self._desc.fieldindex.get(name)
+        if idx is None:
+            raise AttributeError("Msg %s has no field of name %s" % (self.name, name))
+        self._fieldvalues[idx] = value
 
     def __str__(self):
         ret = '%s.%s {' % (self.msg_class, self.name)
@@ -210,7 +497,7 @@ class PprzMessage(object):
         ivy_str = sep.join(fields)
         return ivy_str
 
-    def ivy_string_to_payload(self, data):
+    def ivy_string_to_payload(self, data, typed=False, numpy_arrays=False):
         """
         parse Ivy data string to PPRZ values
         header and message name should have been removed
@@ -218,11 +505,25 @@ class PprzMessage(object):
         Basically parts/args in string are separated by space, but char array can also contain a space:
         ``|f,o,o, ,b,a,r|`` in old format or ``"foo bar"`` in new format
 
+        :param typed: convert numeric fields to int/float according to their type instead of keeping strings
+        :param numpy_arrays: with typed, return numeric arrays as NumPy arrays (numpy is only needed then)
         """
+        if '|' not in data and '"' not in data:
+            # no char array, only split on spaces
+            values = [[x for x in e.split(',') if x != ''] if ',' in e else e
+                      for e in data.split(' ') if e != '']
+        else:
+            values = self._split_ivy_string(data)
+        if typed:
+            values = self._desc.convert_ivy_values(values, numpy_arrays)
+        self.set_values(values)
+
+    @staticmethod
+    def _split_ivy_string(data):
         # first split on array delimiters
         # then slip on spaces and remove empty stings
         values = []
-        for el in re.split('([|\"][^|\"]*[|\"])', data):
+        for el in IVY_STRING_RE.split(data):
             if '|' not in el and '"' not in el:
                 # split non-array strings further up
                 for e in [d for d in el.split(' ') if d != '']:
@@ -235,69 +536,13 @@ class PprzMessage(object):
             else:
                 # add string array (stripped)
                 values.append(str.strip(el))
-        self.set_values(values)
+        return values
 
     def payload_to_binary(self):
-        struct_string = "<"
-        data = []
-        length = 0
-        r = re.compile('[\[\]]')
-        for idx, t in enumerate(self.fieldtypes):
-            bin_type = self.fieldbintypes(t)
-            s = r.split(t)
-            if len(s) > 1: # this is an array
-                array_length = len(self.fieldvalues[idx])
-                if len(s[1]) == 0: # this is a variable length array
-                    struct_string += 'B'
-                    data.append(array_length)
-                    length += 1
-                struct_string += bin_type[0] * array_length
-                length += bin_type[1] * array_length
-                for x in self.fieldvalues[idx]:
-                    if bin_type[0]=='f' or bin_type[0]== 'd':
-                        data.append(float(x))
-                    elif bin_type[0]== 'B' or bin_type[0]== 'H' or bin_type[0]== 'L' or bin_type[0]== 'b' or bin_type[0]== 'h' or bin_type[0]== 'l':
-                        data.append(int(x))
-                    elif bin_type[0]== 'c':
-                        data.append(x.encode())
-                    else:
-                        data.append(x)
-            else:
-                struct_string += bin_type[0]
-                length += bin_type[1]
-                # Assign the right type according to field description
-                if bin_type[0]=='f' or bin_type[0]== 'd':
-                    data.append(float(self.fieldvalues[idx]))
-                elif bin_type[0]== 'B' or bin_type[0]== 'H' or bin_type[0]== 'L' or bin_type[0]== 'b' or bin_type[0]== 'h' or bin_type[0]== 'l':
-                    data.append(int(self.fieldvalues[idx]))
-                else:
-                    data.append(self.fieldvalues[idx])
-        msg = struct.pack(struct_string, *data)
-        return msg
+        return self._desc.codec.pack(self._fieldvalues)
 
     def binary_to_payload(self, data):
-        msg_offset = 0
-        values = []
-        r = re.compile('[\[\]]')
-        for idx, t in enumerate(self.fieldtypes):
-            bin_type = self.fieldbintypes(t)
-            s = r.split(t)
-            if len(s) > 1: # this is an array
-                if len(s[1]) == 0: # this is a variable length array
-                    array_length = data[msg_offset]
-                    msg_offset += 1
-                else:
-                    array_length = int(s[1])
-                array_value = []
-                for count in range(0, array_length):
-                    array_value.append(struct.unpack('<' + bin_type[0], data[msg_offset:msg_offset + bin_type[1]])[0])
-                    msg_offset = msg_offset + bin_type[1]
-                values.append(array_value)
-            else:
-                value = struct.unpack('<' + bin_type[0], data[msg_offset:msg_offset + bin_type[1]])[0]
-                msg_offset = msg_offset + bin_type[1]
-                values.append(value)
-        self.set_values(values)
+        self.set_values(self._desc.codec.unpack(data))
 
 
 def test():
@@ -20,6 +20,10 @@
 from __future__ import absolute_import, print_function
 
 import os
+import hashlib
+import logging
+import pickle
+import threading
 
 # if PAPARAZZI_HOME is set use $PAPARAZZI_HOME/var/messages.xml
 # else assume this file is installed in var/lib/python/pprzlink
@@ -35,15 +39,32 @@ else:
 # Define the pprzlink protocol version
 PROTOCOL_VERSION="2.0"
 
+# compiled definitions are cached in PPRZLINK_CACHE_DIR, or in the user cache directory
+# bump CACHE_VERSION when the layout of the dictionaries changes
+CACHE_VERSION = 2
+PPRZLINK_CACHE_DIR = os.getenv("PPRZLINK_CACHE_DIR")
+if PPRZLINK_CACHE_DIR is None:
+    PPRZLINK_CACHE_DIR = os.path.join(os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+                                      "pprzlink")
+
+logger = logging.getLogger("PprzLink")
+
 message_dictionary = {}
 message_dictionary_types = {}
 message_dictionary_coefs = {}
+message_dictionary_field_index = {}
 message_dictionary_id_name = {}
 message_dictionary_name_id = {}
 message_dictionary_class_id_name = {}
 message_dictionary_class_name_id = {}
 message_dictionary_broadcast = {}
+# message name -> (class name, message id)
+message_dictionary_msg_name = {}
 
+# caches of objects built from the message definitions, emptied when messages are parsed again
+_derived_caches = []
+
+_parse_lock = threading.RLock()
 
 
 class MessagesNotFound(Exception):
@@ -54,31 +75,170 @@ class MessagesNotFound(Exception):
         return "messages file " + repr(self.filename) + " not found"
 
 
-def parse_messages(messages_file=''):
+def register_cache(cache):
+    """Register a dictionary derived from the message definitions, to be cleared on parse_messages"""
+    _derived_caches.append(cache)
+    return cache
+
+
+def _cache_file(messages_file):
+    path_hash = hashlib.sha1(os.path.abspath(messages_file).encode()).hexdigest()[:16]
+    return os.path.join(PPRZLINK_CACHE_DIR, "messages-%s.pickle" % path_hash)
+
+
+def _file_hash(messages_file):
+    with open(messages_file, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _cache_header(messages_file, file_hash=None):
+    st = os.stat(messages_file)
+    return {
+        'version': CACHE_VERSION,
+        'protocol': PROTOCOL_VERSION,
+        'file': os.path.abspath(messages_file),
+        'mtime': st.st_mtime_ns,
+        'size': st.st_size,
+        'hash': file_hash or _file_hash(messages_file),
+    }
+
+
+def _load_cache(messages_file, msg_classes=None):
+    """
+    Load the compiled definitions of messages_file if the cache is up to date
+
+    The cache is valid when the XML file has the same mtime and size, or when
+    its content has the same hash (file touched or copied).
+    Only the classes in msg_classes (all if None) are unpickled.
+    :return: list of class definitions, None if the cache can't be used
+    """
+    cache_file = _cache_file(messages_file)
+    try:
+        with open(cache_file, 'rb') as f:
+            header = pickle.load(f)
+            if header.get('version') != CACHE_VERSION or header.get('protocol') != PROTOCOL_VERSION:
+                return None
+            st = os.stat(messages_file)
+            if header.get('mtime') != st.st_mtime_ns or header.get('size') != st.st_size:
+                file_hash = _file_hash(messages_file)
+                if header.get('hash') != file_hash:
+                    return None
+                touched = True
+            else:
+                touched = False
+            # list of (class name, pickled class definition)
+            classes = pickle.load(f)
+        definitions = [pickle.loads(data) for class_name, data in classes
+                       if msg_classes is None or class_name in msg_classes]
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError) as e:
+        logger.debug("Unable to use messages cache %s: %s" % (cache_file, e))
+        return None
+    if touched:
+        # same content, only refresh the header
+        _save_cache(messages_file, classes, file_hash)
+    return definitions
+
+
+def _save_cache(messages_file, classes, file_hash=None):
+    """Store the compiled definitions, errors are not fatal (read-only file system for instance)"""
+    cache_file = _cache_file(messages_file)
+    tmp_file = "%s.%d.tmp" % (cache_file, os.getpid())
+    try:
+        if not os.path.isdir(PPRZLINK_CACHE_DIR):
+            os.makedirs(PPRZLINK_CACHE_DIR)
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(_cache_header(messages_file, file_hash), f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(classes, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        logger.debug("Unable to write messages cache %s: %s" % (cache_file, e))
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+
+
+def parse_messages(messages_file='', use_cache=True, msg_classes=None):
+    """
+    Load the message definitions from messages_file
+
+    The compiled definitions are loaded from the cache when the file has not changed,
+    otherwise the XML file is parsed and the cache updated.
+
+    :param msg_classes: names of the classes to load (telemetry and datalink for instance),
+                        all classes are loaded if None
+    """
     if not messages_file:
         messages_file = default_messages_file
     if not os.path.isfile(messages_file):
         raise MessagesNotFound(messages_file)
+    with _parse_lock:
+        for cache in _derived_caches:
+            cache.clear()
+        definitions = _load_cache(messages_file, msg_classes) if use_cache else None
+        if definitions is None:
+            definitions = _parse_xml(messages_file)
+            if use_cache:
+                _save_cache(messages_file, [(d['class_name'], pickle.dumps(d, pickle.HIGHEST_PROTOCOL))
+                                            for d in definitions])
+            if msg_classes is not None:
+                definitions = [d for d in definitions if d['class_name'] in msg_classes]
+        for definition in definitions:
+            _add_class(definition)
+
+
+def _add_class(definition):
+    """Add the definition of a class to the module dictionaries"""
+    class_name = definition['class_name']
+    class_id = definition['class_id']
+    if class_id is not None:
+        message_dictionary_class_id_name[class_id] = class_name
+        message_dictionary_class_name_id[class_name] = class_id
+    if class_name not in message_dictionary:
+        message_dictionary_id_name[class_name] = {}
+        message_dictionary_name_id[class_name] = {}
+        message_dictionary[class_name] = {}
+        message_dictionary_types[class_name] = {}
+        message_dictionary_coefs[class_name] = {}
+        message_dictionary_field_index[class_name] = {}
+    message_dictionary_id_name[class_name].update(definition['id_name'])
+    message_dictionary_name_id[class_name].update(definition['name_id'])
+    message_dictionary[class_name].update(definition['fields'])
+    message_dictionary_types[class_name].update(definition['types'])
+    message_dictionary_coefs[class_name].update(definition['coefs'])
+    message_dictionary_field_index[class_name].update(definition['field_index'])
+    message_dictionary_broadcast.update(definition['broadcast'])
+    # the first class defining a message name wins, as classes are added in file order
+    for message_name, message_id in definition['name_id'].items():
+        message_dictionary_msg_name.setdefault(message_name, (class_name, message_id))
+
+
+def _parse_xml(messages_file):
+    """Parse messages_file, return the list of class definitions in file order"""
     #print("Parsing %s" % messages_file)
     from lxml import etree
     tree = etree.parse(messages_file)
+    definitions = []
     for the_class in tree.xpath("//msg_class[@name]"):
         class_name = the_class.attrib['name']
         if 'id' in the_class.attrib:
             class_id = int(the_class.attrib['id'])
-            message_dictionary_class_id_name[class_id] = class_name
-            message_dictionary_class_name_id[class_name] = class_id
         elif 'ID' in the_class.attrib:
             class_id = int(the_class.attrib['ID'])
-            message_dictionary_class_id_name[class_id] = class_name
-            message_dictionary_class_name_id[class_name] = class_id
-
-        if class_name not in message_dictionary:
-            message_dictionary_id_name[class_name] = {}
-            message_dictionary_name_id[class_name] = {}
-            message_dictionary[class_name] = {}
-            message_dictionary_types[class_name] = {}
-            message_dictionary_coefs[class_name] = {}
+        else:
+            class_id = None
+        definition = {
+            'class_name': class_name,
+            'class_id': class_id,
+            'id_name': {},
+            'name_id': {},
+            'fields': {},
+            'types': {},
+            'coefs': {},
+            'field_index': {},
+            'broadcast': {},
+        }
+        definitions.append(definition)
         for the_message in the_class.xpath("message[@name]"):
             message_name = the_message.attrib['name']
             if 'id' in the_message.attrib:
@@ -91,42 +251,45 @@ def parse_messages(messages_file=''):
                 message_id = int(message_id)
 
             if 'link' in the_message.attrib:
-                message_dictionary_broadcast[message_name] = the_message.attrib['link']
+                definition['broadcast'][message_name] = the_message.attrib['link']
             else:
-                message_dictionary_broadcast[message_name] = 'forwarded' # Default behavior is to send message to destination only
+                definition['broadcast'][message_name] = 'forwarded' # Default behavior is to send message to destination only
 
-            message_dictionary_id_name[class_name][message_id] = message_name
-            message_dictionary_name_id[class_name][message_name] = message_id
+            definition['id_name'][message_id] = message_name
+            definition['name_id'][message_name] = message_id
 
             # insert this message into our dictionary as a list with room for the fields
-            message_dictionary[class_name][message_name] = []
-            message_dictionary_types[class_name][message_id] = []
-            message_dictionary_coefs[class_name][message_id] = []
+            fields = definition['fields'][message_name] = []
+            types = definition['types'][message_id] = []
+            coefs = definition['coefs'][message_id] = []
+            field_index = definition['field_index'][message_id] = {}
 
             for the_field in the_message.xpath('field[@name]'):
                 # for now, just save the field names -- in the future maybe expand this to save a struct?
-                message_dictionary[class_name][message_name].append(the_field.attrib['name'])
-                message_dictionary_types[class_name][message_id].append(the_field.attrib['type'])
+                field_index.setdefault(the_field.attrib['name'], len(fields))
+                fields.append(the_field.attrib['name'])
+                types.append(the_field.attrib['type'])
                 try:
-                    message_dictionary_coefs[class_name][message_id].append(float(the_field.attrib['alt_unit_coef']))
+                    coefs.append(float(the_field.attrib['alt_unit_coef']))
                 except KeyError:
                     # print("no such key")
-                    message_dictionary_coefs[class_name][message_id].append(1.)
+                    coefs.append(1.)
+    return definitions
 
 
 def _ensure_message_dictionary():
     if not message_dictionary:
-        parse_messages()
+        with _parse_lock:
+            if not message_dictionary:
+                parse_messages()
 
 
 def find_msg_by_name(name):
     _ensure_message_dictionary()
-    for msg_class, msg_name in message_dictionary.items():
-        if name in msg_name:
-            #print("found msg name %s in class %s" % (name, msg_class))
-            return msg_class, name
-
-    raise ValueError("Error: msg_name %s not found." % name)
+    try:
+        return message_dictionary_msg_name[name][0], name
+    except KeyError:
+        raise ValueError("Error: msg_name %s not found." % name)
 
 
 def get_msgs(msg_class):
@@ -210,6 +373,18 @@ def get_msg_fieldcoefs(msg_class, msg_id):
     return message_dictionary_coefs[msg_class][msg_id]
 
 
+def get_msg_field_index(msg_class, msg_id):
+    _ensure_message_dictionary()
+
+    if msg_class not in message_dictionary_field_index:
+        raise ValueError("Error: msg_class %s not found." % msg_class)
+
+    if msg_id not in message_dictionary_field_index[msg_class]:
+        raise ValueError("Error: message with ID %d not found in msg_class %s." % (msg_id, msg_class))
+
+    return message_dictionary_field_index[msg_class][msg_id]
+
+
 def test():
     import argparse
     parser = argparse.ArgumentParser()
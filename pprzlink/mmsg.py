@@ -0,0 +1,246 @@
+#
+# This file is part of PPRZLINK.
+#
+# PPRZLINK is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PPRZLINK is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PPRZLINK.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Batched datagram I/O: many UDP datagrams per system call
+
+On Linux, recvmmsg and sendmmsg are called through ctypes. Elsewhere, or for
+non IPv4 sockets, the socket is drained without blocking, one datagram per call.
+"""
+
+from __future__ import absolute_import, division
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import socket
+import struct
+import sys
+
+
+logger = logging.getLogger("PprzLink")
+
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0x40)
+SOCKADDR_IN_SIZE = 16
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.c_void_p),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _msghdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+        libc.recvmmsg.restype = ctypes.c_int
+        libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+        libc.sendmmsg.restype = ctypes.c_int
+    except (OSError, AttributeError) as e:
+        logger.info("recvmmsg/sendmmsg not available (%s)" % e)
+        return None
+    return libc
+
+
+_libc = _load_libc()
+
+
+def mmsg_available():
+    """True if recvmmsg and sendmmsg can be used on this system"""
+    return _libc is not None
+
+
+class DatagramBatch(object):
+    """
+    Receive and send UDP datagrams in batches on a socket
+
+    The mode of the socket is not changed, sends of other threads keep its blocking or timeout
+    behaviour: recv waits for it to be readable with select, then gets the datagrams with
+    recvmmsg and MSG_DONTWAIT, or one at a time while select reports it readable. Received datagrams are stored in one preallocated buffer, one slot of buffer_size bytes
+    per datagram, and returned as (offset, length, address): they are only valid until the next recv.
+    """
+    def __init__(self, sock, batch_size=64, buffer_size=2048, use_mmsg=True):
+        self.sock = sock
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.buffer = bytearray(batch_size * buffer_size)
+        self.use_mmsg = use_mmsg and _libc is not None and sock.family == socket.AF_INET
+        # counters
+        self.recv_calls = 0
+        self.received = 0
+        self.send_calls = 0
+        self.sent = 0
+        self._addresses = {}        # raw sockaddr -> (host, port)
+        self._sockaddrs = {}        # (host, port) -> raw sockaddr
+        if self.use_mmsg:
+            self._setup_recv()
+            self._setup_send(batch_size)
+
+    def _setup_recv(self):
+        # kept as attributes: the kernel writes in them on each recvmmsg
+        self._buffer_ref = ctypes.c_char.from_buffer(self.buffer)
+        base = ctypes.addressof(self._buffer_ref)
+        self._names = ctypes.create_string_buffer(SOCKADDR_IN_SIZE * self.batch_size)
+        self._names_view = memoryview(self._names).cast('B')
+        names = ctypes.addressof(self._names)
+        self._iovecs = (_iovec * self.batch_size)()
+        self._headers = (_mmsghdr * self.batch_size)()
+        for i in range(self.batch_size):
+            self._iovecs[i].iov_base = base + i * self.buffer_size
+            self._iovecs[i].iov_len = self.buffer_size
+            header = self._headers[i].msg_hdr
+            header.msg_name = names + i * SOCKADDR_IN_SIZE
+            header.msg_namelen = SOCKADDR_IN_SIZE
+            header.msg_iov = ctypes.addressof(self._iovecs) + i * ctypes.sizeof(_iovec)
+            header.msg_iovlen = 1
+
+    def recv(self, timeout=None):
+        """Wait up to timeout (s) for incoming datagrams, return the list of (offset, length, address) received"""
+        if not select.select([self.sock], [], [], timeout)[0]:
+            return []
+        if self.use_mmsg:
+            datagrams = self._recvmmsg()
+        else:
+            datagrams = self._recv_drain()
+        self.received += len(datagrams)
+        return datagrams
+
+    def _recvmmsg(self):
+        headers = self._headers
+        nb = _libc.recvmmsg(self.sock.fileno(), ctypes.addressof(headers), self.batch_size, MSG_DONTWAIT, None)
+        self.recv_calls += 1
+        if nb < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(err, os.strerror(err))
+        datagrams = []
+        names = self._names_view
+        for i in range(nb):
+            start = i * SOCKADDR_IN_SIZE
+            raw = bytes(names[start + 2:start + 8])
+            address = self._addresses.get(raw)
+            if address is None:
+                address = self._addresses[raw] = (socket.inet_ntoa(raw[2:]), struct.unpack('!H', raw[:2])[0])
+            datagrams.append((i * self.buffer_size, headers[i].msg_len, address))
+            headers[i].msg_hdr.msg_namelen = SOCKADDR_IN_SIZE
+        return datagrams
+
+    def _recv_drain(self):
+        datagrams = []
+        view = memoryview(self.buffer)
+        for i in range(self.batch_size):
+            offset = i * self.buffer_size
+            # the socket may block or have a timeout, only read while a datagram is waiting
+            if i > 0 and not select.select([self.sock], [], [], 0)[0]:
+                break
+            try:
+                length, address = self.sock.recvfrom_into(view[offset:offset + self.buffer_size])
+            except (BlockingIOError, InterruptedError):
+                break
+            finally:
+                self.recv_calls += 1
+            datagrams.append((offset, length, address))
+        return datagrams
+
+    def _sockaddr(self, address):
+        raw = self._sockaddrs.get(address)
+        if raw is None:
+            host, port = address
+            raw = self._sockaddrs[address] = struct.pack('=H', socket.AF_INET) + struct.pack('!H', port) + \
+                socket.inet_aton(socket.gethostbyname(host)) + bytes(8)
+        return raw
+
+    def send(self, datagrams):
+        """Send a list of (data, address) datagrams, waiting for the socket to be writable if needed"""
+        if not datagrams:
+            return
+        if self.use_mmsg:
+            self._sendmmsg(datagrams)
+        else:
+            for data, address in datagrams:
+                while True:
+                    self.send_calls += 1
+                    try:
+                        self.sock.sendto(data, address)
+                        break
+                    except (BlockingIOError, InterruptedError):
+                        select.select([], [self.sock], [], 1.0)
+        self.sent += len(datagrams)
+
+    def _setup_send(self, capacity):
+        self._send_capacity = capacity
+        self._send_names = ctypes.create_string_buffer(SOCKADDR_IN_SIZE * capacity)
+        self._send_iovecs = (_iovec * capacity)()
+        self._send_iovecs_view = memoryview(self._send_iovecs).cast('B')
+        self._send_headers = (_mmsghdr * capacity)()
+        names = ctypes.addressof(self._send_names)
+        for i in range(capacity):
+            header = self._send_headers[i].msg_hdr
+            header.msg_name = names + i * SOCKADDR_IN_SIZE
+            header.msg_namelen = SOCKADDR_IN_SIZE
+            header.msg_iov = ctypes.addressof(self._send_iovecs) + i * ctypes.sizeof(_iovec)
+            header.msg_iovlen = 1
+
+    def _sendmmsg(self, datagrams):
+        nb = len(datagrams)
+        if nb > self._send_capacity:
+            self._setup_send(max(nb, 2 * self._send_capacity))
+        # all the datagrams in one buffer, iovecs (pointer, size) point into it
+        payload = b''.join(data for data, _ in datagrams)
+        names = b''.join(self._sockaddr(address) for _, address in datagrams)
+        ctypes.memmove(self._send_names, names, len(names))
+        payload_ref = ctypes.c_char_p(payload)
+        base = ctypes.cast(payload_ref, ctypes.c_void_p).value
+        iovecs = []
+        for data, _ in datagrams:
+            iovecs.append(base)
+            iovecs.append(len(data))
+            base += len(data)
+        struct.pack_into('PN' * nb, self._send_iovecs_view, 0, *iovecs)
+        headers = ctypes.addressof(self._send_headers)
+        done = 0
+        while done < nb:
+            sent = _libc.sendmmsg(self.sock.fileno(), headers + done * ctypes.sizeof(_mmsghdr), nb - done, 0)
+            self.send_calls += 1
+            if sent < 0:
+                err = ctypes.get_errno()
+                if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    select.select([], [self.sock], [], 1.0)
+                    continue
+                raise OSError(err, os.strerror(err))
+            done += sent
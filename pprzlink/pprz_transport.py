@@ -22,6 +22,7 @@ Paparazzi transport encoding utilities
 
 from __future__ import absolute_import, division
 import struct
+from itertools import accumulate
 from pprzlink.message import PprzMessage
 
 # use Enum from python 3.4 if available (https://www.python.org/dev/peps/pep-0435/)
@@ -32,6 +33,13 @@ except ImportError:
     Enum = object
 
 STX = 0x99
+STX_BYTE = struct.pack("<B", STX)
+
+# smallest frame: STX + length + sender_id + receiver + comp/class + msg_id + ck_a + ck_b
+MIN_FRAME_LENGTH = 8
+# the length byte counts the whole frame, the message buffer returned by feed is at most 251 bytes
+MAX_FRAME_LENGTH = 255
+MAX_BUFFER_LENGTH = MAX_FRAME_LENGTH - 4
 
 class PprzParserState(Enum):
     WaitSTX = 1
@@ -53,6 +61,7 @@ class PprzTransport(object):
         self.ck_a = 0
         self.ck_b = 0
         self.idx = 0
+        self.pending = b''
 
     def parse_byte(self, c):
         """parse new byte, return True when a new full message is available"""
@@ -91,6 +100,73 @@ class PprzTransport(object):
             self.state = PprzParserState.WaitSTX
         return False
 
+    def feed(self, buffer):
+        """
+        parse a chunk of incoming data, return the list of complete messages found
+
+        Each returned element has the same layout as the buffer returned by get_buffer
+        (sender_id, receiver_id, comp/class, msg_id, payload) and can be passed to unpack_pprz_msg.
+        Bytes of an incomplete message at the end of the chunk are kept until the next call.
+        """
+        if self.pending:
+            data = self.pending + bytes(buffer)
+        else:
+            data = bytes(buffer)
+        frames = []
+        end = len(data)
+        idx = data.find(STX_BYTE)
+        while 0 <= idx < end - 1:
+            length = data[idx + 1]
+            if length < MIN_FRAME_LENGTH:
+                idx = data.find(STX_BYTE, idx + 1)
+                continue
+            if idx + length > end:
+                # wait for the end of the message
+                break
+            # checksum covers the length byte and the message, not the STX
+            checked = data[idx + 1:idx + length - 2]
+            ck_a = sum(checked) & 0xFF
+            ck_b = sum(accumulate(checked)) & 0xFF
+            if ck_a == data[idx + length - 2] and ck_b == data[idx + length - 1]:
+                frames.append(checked[1:])
+                idx = data.find(STX_BYTE, idx + length)
+            else:
+                idx = data.find(STX_BYTE, idx + 1)
+        if idx < 0:
+            self.pending = b''
+        else:
+            self.pending = data[idx:]
+        return frames
+
+    @staticmethod
+    def feed_view(buffer, nbytes=None, offset=0):
+        """
+        parse the complete messages of a received buffer without copying, return them as memoryviews
+
+        Unlike feed, no state is kept between calls: buffer must only hold whole messages, like
+        a UDP datagram received with recvfrom_into. Only the nbytes bytes from offset are parsed
+        (up to the end of buffer if nbytes is None). The returned views point into buffer
+        (same layout as the elements returned by feed), they are only valid until it is reused.
+        """
+        end = len(buffer) if nbytes is None else offset + nbytes
+        view = memoryview(buffer)
+        frames = []
+        idx = buffer.find(STX_BYTE, offset, end)
+        while 0 <= idx < end - 1:
+            length = buffer[idx + 1]
+            if length < MIN_FRAME_LENGTH or idx + length > end:
+                idx = buffer.find(STX_BYTE, idx + 1, end)
+                continue
+            checked = view[idx + 1:idx + length - 2]
+            ck_a = sum(checked) & 0xFF
+            ck_b = sum(accumulate(checked)) & 0xFF
+            if ck_a == buffer[idx + length - 2] and ck_b == buffer[idx + length - 1]:
+                frames.append(checked[1:])
+                idx = buffer.find(STX_BYTE, idx + length, end)
+            else:
+                idx = buffer.find(STX_BYTE, idx + 1, end)
+        return frames
+
     def get_buffer(self):
         return self.buf
 
@@ -0,0 +1,273 @@
+#
+# This file is part of PPRZLINK.
+#
+# PPRZLINK is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PPRZLINK is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PPRZLINK.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+Flight recorder: append-only binary log of frames, states and commands
+
+The log is a directory of segments, files of fixed-width records mapped in memory:
+recording a record is a copy into the mapping, the OS writes it to the file, so the
+data survives a crash of the process. When a segment is full, the next one is created.
+
+Segment layout: one header record (magic, version, record size, capacity, segment number,
+creation time) followed by `capacity` records of RECORD_SIZE bytes:
+
+    timestamp (float64, time.time()) | kind (uint8) | source (uint8) | length (uint16) | reserved (uint32) | data
+
+Unused records are zeroed (kind 0), a record is only valid once its header is written.
+The index file has one fixed-width entry per closed segment: number, records, first and
+last timestamps.
+
+    recorder = FlightRecorder('logs/flight1')
+    interface.recorder = recorder   # raw frames, recorded by the interfaces
+    ...
+    for timestamp, kind, source, data in FlightLog('logs/flight1').records([REC_FRAME]):
+        ...
+"""
+
+from __future__ import absolute_import
+
+import glob
+import mmap
+import os
+import struct
+import threading
+import time
+
+from pprzlink.message import PprzMessageError
+from pprzlink.pprz_transport import MAX_BUFFER_LENGTH
+
+
+RECORD_SIZE = 272
+RECORD_HEADER = struct.Struct('<dBBHI')
+DATA_SIZE = RECORD_SIZE - RECORD_HEADER.size
+
+SEGMENT_MAGIC = b'PPRZREC\x01'
+SEGMENT_HEADER = struct.Struct('<8sIIIId')
+SEGMENT_VERSION = 1
+INDEX_ENTRY = struct.Struct('<IIdd')
+
+# record kinds
+REC_FRAME = 1       # message buffer (sender_id, receiver_id, comp/class, msg_id, payload) as returned by PprzTransport.feed
+REC_STATE = 2       # ac_id, position, velocity, attitude (STATE_STRUCT)
+REC_COMMAND = 3     # ac_id, flag, north, east, down acceleration setpoint (COMMAND_STRUCT)
+
+STATE_STRUCT = struct.Struct('<B9d')
+COMMAND_STRUCT = struct.Struct('<BB3d')
+FRAME_HEADER = struct.Struct('<BBBB')
+
+
+def segment_path(directory, prefix, number):
+    return os.path.join(directory, '%s-%05d.seg' % (prefix, number))
+
+
+def index_path(directory, prefix):
+    return os.path.join(directory, '%s.idx' % prefix)
+
+
+class FlightRecorder(object):
+    """
+    Writer of a flight log
+
+    Thread safe, records can come from the reader threads of the interfaces and from the control loop.
+    A new recorder on an existing log directory appends new segments after the existing ones.
+    """
+    def __init__(self, directory, segment_records=65536, prefix='flight', clock=time.time):
+        self.directory = directory
+        self.prefix = prefix
+        self.segment_records = segment_records
+        self.clock = clock
+        self.records = 0
+        self.segment = None
+        self._mm = None
+        self._next = 0
+        self._first = None
+        self._last = None
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        existing = sorted(glob.glob(os.path.join(directory, '%s-*.seg' % prefix)))
+        number = int(existing[-1][-9:-4]) + 1 if existing else 0
+        self._open_segment(number)
+
+    def _open_segment(self, number):
+        size = RECORD_SIZE * (self.segment_records + 1)
+        with open(segment_path(self.directory, self.prefix, number), 'w+b') as f:
+            # allocate the blocks now: a full disk fails here with an OSError, not later with a
+            # SIGBUS on the first write to an unbacked page of a sparse file
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(f.fileno(), 0, size)
+            else:
+                f.truncate(size)
+            self._mm = mmap.mmap(f.fileno(), size)
+        SEGMENT_HEADER.pack_into(self._mm, 0, SEGMENT_MAGIC, SEGMENT_VERSION, RECORD_SIZE, self.segment_records,
+                                 number, self.clock())
+        self.segment = number
+        self._next = 1
+        self._first = None
+        self._last = None
+
+    def _close_segment(self):
+        self._mm.flush()
+        self._mm.close()
+        self._mm = None
+        with open(index_path(self.directory, self.prefix), 'ab') as f:
+            f.write(INDEX_ENTRY.pack(self.segment, self._next - 1, self._first or 0., self._last or 0.))
+
+    def record(self, kind, data, source=0, timestamp=None):
+        """Append a record of kind with data (at most DATA_SIZE bytes)"""
+        if timestamp is None:
+            timestamp = self.clock()
+        length = len(data)
+        if length > DATA_SIZE:
+            raise ValueError("Error: record of %d bytes, %d max" % (length, DATA_SIZE))
+        with self._lock:
+            if self._mm is None:
+                return
+            if self._next > self.segment_records:
+                self._close_segment()
+                self._open_segment(self.segment + 1)
+            offset = self._next * RECORD_SIZE
+            self._mm[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length] = data
+            # header last, the record is valid once its kind is set
+            RECORD_HEADER.pack_into(self._mm, offset, timestamp, kind, source, length, 0)
+            self._next += 1
+            if self._first is None:
+                self._first = timestamp
+            self._last = timestamp
+            self.records += 1
+
+    def record_frame(self, buffer, source=0, timestamp=None):
+        """Record a received message buffer (as returned by PprzTransport.feed), at most MAX_BUFFER_LENGTH bytes"""
+        if len(buffer) > MAX_BUFFER_LENGTH:
+            raise ValueError("Error: message buffer of %d bytes, %d max" % (len(buffer), MAX_BUFFER_LENGTH))
+        self.record(REC_FRAME, buffer, source, timestamp)
+
+    def record_message(self, sender_id, msg, receiver_id=0, component_id=0, source=0, timestamp=None):
+        """
+        Record a decoded message as a frame
+
+        Skipped if it has no binary encoding (e.g. string fields), if it is too long for a frame
+        or if sender_id is not a number (untyped Ivy interfaces give it as a string, converted here).
+        """
+        try:
+            sender_id = int(sender_id)
+            payload = msg.payload_to_binary()
+        except (PprzMessageError, struct.error, TypeError, ValueError):
+            return
+        if FRAME_HEADER.size + len(payload) > MAX_BUFFER_LENGTH:
+            return
+        header = FRAME_HEADER.pack(sender_id & 0xFF, receiver_id & 0xFF,
+                                   ((component_id & 0x0F) << 4) | (msg.class_id & 0x0F), msg.msg_id)
+        self.record(REC_FRAME, header + payload, source, timestamp)
+
+    def record_state(self, ac_id, position, velocity, attitude, timestamp=None):
+        self.record(REC_STATE, STATE_STRUCT.pack(ac_id, position[0], position[1], position[2],
+                                                 velocity[0], velocity[1], velocity[2],
+                                                 attitude[0], attitude[1], attitude[2]), 0, timestamp)
+
+    def record_command(self, ac_id, flag, north, east, down, timestamp=None):
+        self.record(REC_COMMAND, COMMAND_STRUCT.pack(ac_id, flag, north, east, down), 0, timestamp)
+
+    def flush(self):
+        """Write the current segment to disk, only needed to survive a crash of the system"""
+        with self._lock:
+            if self._mm is not None:
+                self._mm.flush()
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._close_segment()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class FlightLog(object):
+    """Reader of a flight log, including the segment being written or left open by a crash"""
+    def __init__(self, directory, prefix='flight'):
+        self.directory = directory
+        self.prefix = prefix
+
+    def segments(self):
+        """Paths of the segments, in recording order"""
+        return sorted(glob.glob(os.path.join(self.directory, '%s-*.seg' % self.prefix)))
+
+    def index(self):
+        """List of (segment, records, first timestamp, last timestamp) of the closed segments"""
+        try:
+            with open(index_path(self.directory, self.prefix), 'rb') as f:
+                data = f.read()
+        except IOError:
+            return []
+        return [INDEX_ENTRY.unpack_from(data, i) for i in range(0, len(data) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size)]
+
+    @staticmethod
+    def read_segment_header(data):
+        magic, version, record_size, capacity, number, created = SEGMENT_HEADER.unpack_from(data, 0)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION or record_size != RECORD_SIZE:
+            raise ValueError("Error: not a flight log segment (version %d)" % SEGMENT_VERSION)
+        return capacity, number, created
+
+    def records(self, kinds=None, start=None, end=None):
+        """
+        Iterate over the (timestamp, kind, source, data) records
+
+        :param kinds: only records of these kinds, all if None
+        :param start, end: only records in this time range, segments outside of it are skipped using the index
+        """
+        index = dict((entry[0], entry) for entry in self.index())
+        for path in self.segments():
+            number = int(path[-9:-4])
+            entry = index.get(number)
+            if entry is not None and entry[1] > 0 and ((start is not None and entry[3] < start) or
+                                                       (end is not None and entry[2] > end)):
+                continue
+            with open(path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                capacity, _, _ = self.read_segment_header(mm)
+                for offset in range(RECORD_SIZE, RECORD_SIZE * (capacity + 1), RECORD_SIZE):
+                    timestamp, kind, source, length, _ = RECORD_HEADER.unpack_from(mm, offset)
+                    if kind == 0:
+                        break
+                    if (kinds is not None and kind not in kinds) or (start is not None and timestamp < start):
+                        continue
+                    if end is not None and timestamp > end:
+                        return
+                    data_offset = offset + RECORD_HEADER.size
+                    yield timestamp, kind, source, mm[data_offset:data_offset + length]
+            finally:
+                mm.close()
+
+    def segment_array(self, path):
+        """Records of a segment as a NumPy structured array (see record_dtype), numpy is only needed here"""
+        import numpy as np
+        with open(path, 'rb') as f:
+            capacity, _, _ = self.read_segment_header(f.read(SEGMENT_HEADER.size))
+        records = np.memmap(path, dtype=record_dtype(), mode='r', offset=RECORD_SIZE, shape=(capacity,))
+        used = np.flatnonzero(records['kind'] == 0)
+        return records[:used[0]] if len(used) else records
+
+
+def record_dtype():
+    import numpy as np
+    return np.dtype([('timestamp', '<f8'), ('kind', 'u1'), ('source', 'u1'), ('length', '<u2'),
+                     ('reserved', '<u4'), ('data', 'u1', (DATA_SIZE,))])
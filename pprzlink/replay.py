@@ -0,0 +1,187 @@
+#
+# This file is part of PPRZLINK.
+#
+# PPRZLINK is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PPRZLINK is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with PPRZLINK.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+"""
+PPRZLINK replay of a flight log as an interface
+
+The message buffers recorded by a FlightRecorder (as returned by PprzTransport.feed) are
+decoded directly, without framing them again, then given to the callback with the same
+signature as SerialMessagesInterface. Ivy-like subscriptions are also supported.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import logging
+import re
+import struct
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from pprzlink.message import PprzMessage
+from pprzlink.pprz_transport import PprzTransport, MAX_BUFFER_LENGTH
+from pprzlink.recorder import FlightLog, REC_FRAME
+
+
+logger = logging.getLogger("PprzLink")
+
+
+class ReplayMessagesInterface(threading.Thread):
+    """
+    Interface playing the frames of a flight log
+
+    :param speed: replay speed, 1 for real time, 10 for ten times faster, None (or 0) as fast as possible
+    :param loop: start again at the end of the log
+    :param interface_id: only messages to this receiver are given to the callback, None for all
+    """
+    def __init__(self, callback, log_dir, verbose=False, msg_class='telemetry', interface_id=0,
+                 speed=1., loop=False, start_time=None, end_time=None, prefix='flight'):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.callback = callback
+        self.verbose = verbose
+        self.msg_class = msg_class
+        self.id = interface_id
+        self.speed = speed
+        self.loop = loop
+        self.running = True
+        self.log = FlightLog(log_dir, prefix)
+        self.start_time = start_time
+        self.end_time = end_time
+        self.trans = PprzTransport(msg_class)
+        self.replayed = 0
+        self.skipped = 0
+        self.sent = deque(maxlen=1000)  # messages sent to the (absent) aircraft, for inspection
+        self.finished = threading.Event()
+        self.recorder = None
+        self._subscriptions = {}
+        self._next_bind_id = 0
+
+    def stop(self):
+        logger.info("End replay")
+        self.running = False
+
+    def shutdown(self):
+        self.stop()
+
+    def send(self, msg, *args, **kwargs):
+        """Nothing is sent during a replay, the messages are kept in self.sent"""
+        if isinstance(msg, PprzMessage):
+            self.sent.append(msg)
+
+    @contextmanager
+    def batch(self):
+        yield
+
+    def subscribe(self, callback, regex_or_msg='(.*)'):
+        """
+        Call callback with ac_id and PprzMessage for the matching messages, like IvyMessagesInterface.subscribe
+
+        A regex is matched against '<ac_id> <message name>'.
+        """
+        if isinstance(regex_or_msg, PprzMessage):
+            match = regex_or_msg.name
+        else:
+            match = re.compile(regex_or_msg)
+        bind_id = self._next_bind_id
+        self._next_bind_id += 1
+        self._subscriptions[bind_id] = (callback, match)
+        return bind_id
+
+    def unsubscribe(self, bind_id):
+        self._subscriptions.pop(bind_id, None)
+
+    def unsubscribe_all(self):
+        self._subscriptions = {}
+
+    def process_frame(self, data):
+        """Decode a complete message buffer and call the callback and subscribers"""
+        try:
+            (sender_id, receiver_id, component_id, msg) = self.trans.unpack_pprz_msg(data)
+        except (ValueError, IndexError, struct.error) as e:
+            logger.warning("Ignoring unknown or malformed message, %s" % e)
+            self.skipped += 1
+            return
+        if self.verbose:
+            logger.info("Replayed message '%s' from %i (%i) to %i" % (msg.name, sender_id, component_id, receiver_id))
+        self.replayed += 1
+        if self.callback is not None and (self.id is None or self.id == receiver_id):
+            self.callback(sender_id, msg)
+        for callback, match in list(self._subscriptions.values()):
+            if isinstance(match, str):
+                if match != msg.name:
+                    continue
+            elif not match.search("%i %s" % (sender_id, msg.name)):
+                continue
+            callback(sender_id, msg)
+
+    def run(self):
+        """Thread running function"""
+        try:
+            while self.running:
+                self.play()
+                if not self.loop:
+                    break
+        finally:
+            self.finished.set()
+
+    def play(self):
+        """Play the log once, at self.speed"""
+        start = time.monotonic()
+        first = None
+        for timestamp, _, _, data in self.log.records([REC_FRAME], self.start_time, self.end_time):
+            if not self.running:
+                return
+            if first is None:
+                first = timestamp
+            if self.speed:
+                delay = start + (timestamp - first) / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            if not 4 <= len(data) <= MAX_BUFFER_LENGTH:
+                logger.warning("Skipping a record of %d bytes, not a message buffer" % len(data))
+                self.skipped += 1
+                continue
+            self.process_frame(data)
+
+
+def test():
+    import argparse
+    from pprzlink import messages_xml_map
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("log_dir", help="flight log directory")
+    parser.add_argument("-f", "--file", help="path to messages.xml file")
+    parser.add_argument("-c", "--class", help="message class", dest='msg_class', default='telemetry')
+    parser.add_argument("-s", "--speed", help="replay speed, 0 for as fast as possible", dest='speed', default=1., type=float)
+    args = parser.parse_args()
+    messages_xml_map.parse_messages(args.file)
+    replay = ReplayMessagesInterface(lambda s, m: print("new message from %i: %s" % (s, m)), args.log_dir,
+                                     msg_class=args.msg_class, interface_id=None, speed=args.speed)
+    try:
+        start = time.monotonic()
+        replay.start()
+        replay.finished.wait()
+        print("%i messages replayed in %.2f s" % (replay.replayed, time.monotonic() - start))
+    except (KeyboardInterrupt, SystemExit):
+        print('Shutting down...')
+        replay.stop()
+
+
+if __name__ == '__main__':
+    test()
@@ -20,6 +20,11 @@ from __future__ import absolute_import, division, print_function
 import threading
 import serial
 import logging
+from contextlib import contextmanager
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 
 from pprzlink.message import PprzMessage
@@ -28,26 +33,68 @@ from pprzlink.pprz_transport import PprzTransport
 
 logger = logging.getLogger("PprzLink")
 
+# reader modes
+READ_BYTE = 'byte'          # one byte per read call, parsed with PprzTransport.parse_byte
+READ_WAITING = 'waiting'    # everything in the input buffer, parsed with PprzTransport.feed
+READ_BLOCK = 'block'        # up to block_size bytes with a short timeout, parsed with PprzTransport.feed
+
+# sender modes
+SEND_DIRECT = 'direct'      # written by the calling thread
+SEND_QUEUED = 'queued'      # queued and written by a writer thread, frames queued together are written at once
+
+# flush policies
+FLUSH_ALWAYS = 'always'     # wait for the output to be transmitted after each write
+FLUSH_NEVER = 'never'       # leave the output to the OS buffers
+
 
 class SerialMessagesInterface(threading.Thread):
     def __init__(self, callback, verbose=False, device='/dev/ttyUSB0', baudrate=115200,
-                 msg_class='telemetry', interface_id=0):
+                 msg_class='telemetry', interface_id=0, read_mode=READ_BYTE,
+                 block_size=256, block_timeout=0.01, send_mode=SEND_DIRECT, flush_policy=FLUSH_ALWAYS):
         threading.Thread.__init__(self)
         self.callback = callback
         self.verbose = verbose
         self.msg_class = msg_class
         self.id = interface_id
         self.running = True
+        if read_mode not in (READ_BYTE, READ_WAITING, READ_BLOCK):
+            raise ValueError("Error: unknown read mode '%s'" % read_mode)
+        self.read_mode = read_mode
+        self.block_size = block_size
+        if send_mode not in (SEND_DIRECT, SEND_QUEUED):
+            raise ValueError("Error: unknown send mode '%s'" % send_mode)
+        if flush_policy not in (FLUSH_ALWAYS, FLUSH_NEVER):
+            raise ValueError("Error: unknown flush policy '%s'" % flush_policy)
+        self.send_mode = send_mode
+        self.flush_policy = flush_policy
+        self.frames_sent = 0
+        self.writes = 0
+        self._batch = None      # frames of the current batch, see batch()
+        self._batch_lock = threading.Lock()
+        self.recorder = None    # FlightRecorder of the received frames
+        timeout = block_timeout if read_mode == READ_BLOCK else 1.0
         try:
-            self.ser = serial.Serial(device, baudrate, timeout=1.0)
+            self.ser = serial.Serial(device, baudrate, timeout=timeout)
         except serial.SerialException:
             logger.error("Error: unable to open serial port '%s'" % device)
             exit(0)
         self.trans = PprzTransport(msg_class)
+        self._send_queue = None
+        self._writer = None
+        if send_mode == SEND_QUEUED:
+            self._send_queue = queue.Queue()
+            self._writer = threading.Thread(target=self._write_loop, name='serial writer')
+            self._writer.daemon = True
+            self._writer.start()
 
     def stop(self):
         logger.info("End thread and close serial link")
         self.running = False
+        if self._writer is not None:
+            # pending frames are written before closing
+            self._send_queue.put(None)
+            self._writer.join(2.0)
+            self._writer = None
         self.ser.close()
 
     def shutdown(self):
@@ -60,30 +107,120 @@ class SerialMessagesInterface(threading.Thread):
             pass
 
     def send(self, msg, sender_id=0,receiver_id=0, component_id=0):
-        """ Send a message over a serial link"""
+        """
+        Send a message over a serial link
+
+        In queued mode or within a batch, the frame is only queued and the call doesn't block.
+        """
         if isinstance(msg, PprzMessage):
             data = self.trans.pack_pprz_msg(sender_id, msg, receiver_id, component_id)
-            self.ser.write(data)
+            self.frames_sent += 1
+            with self._batch_lock:
+                if self._batch is not None:
+                    self._batch.append(data)
+                    return
+            self._send_data(data)
+
+    def _send_data(self, data):
+        if self._send_queue is not None:
+            self._send_queue.put(data)
+        else:
+            self._write(data)
+
+    def _write(self, data):
+        self.ser.write(data)
+        if self.flush_policy == FLUSH_ALWAYS:
             self.ser.flush()
+        self.writes += 1
+
+    @contextmanager
+    def batch(self):
+        """
+        Coalesce the frames sent within the block into a single write
+
+        Typically around one tick of the control loop, frames can be sent from any thread.
+        """
+        with self._batch_lock:
+            outer = self._batch is None
+            if outer:
+                self._batch = []
+        if not outer:
+            # nested, the outer batch sends everything
+            yield
+            return
+        try:
+            yield
+        finally:
+            with self._batch_lock:
+                frames, self._batch = self._batch, None
+            if frames:
+                self._send_data(b''.join(frames))
+
+    def _write_loop(self):
+        """Writer thread: writes everything queued since the previous write at once"""
+        while True:
+            chunks = [self._send_queue.get()]
+            while True:
+                try:
+                    chunks.append(self._send_queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in chunks
+            data = b''.join(c for c in chunks if c is not None)
+            if data:
+                try:
+                    self._write(data)
+                except (serial.SerialException, OSError) as e:
+                    logger.error("Error: unable to write on serial port, %s" % e)
+            if stop:
+                return
+
+    def read(self):
+        """Read the next chunk of incoming data according to the reader mode"""
+        if self.read_mode == READ_WAITING:
+            # block on the first byte, then take whatever arrived with it
+            data = self.ser.read(1)
+            waiting = self.ser.in_waiting
+            if data and waiting:
+                data += self.ser.read(waiting)
+            return data
+        elif self.read_mode == READ_BLOCK:
+            return self.ser.read(self.block_size)
+        return self.ser.read(1)
+
+    def process_frame(self, data):
+        """Decode a complete message buffer and call the callback"""
+        if self.recorder is not None:
+            # recording never gets in the way of the callback
+            try:
+                self.recorder.record_frame(data)
+            except Exception:
+                logger.exception("Error while recording a frame")
+        try:
+            (sender_id, receiver_id, component_id, msg) = self.trans.unpack_pprz_msg(data)
+        except ValueError as e:
+            logger.warning("Ignoring unknown message, %s" % e)
+        else:
+            if self.verbose:  # See the note on the same line in v1.0
+                logger.info("New incoming message '%s' from %i (%i) to %i" % (msg.name, sender_id, component_id, receiver_id))
+            # Callback function on new message
+            if self.id == receiver_id:
+                self.callback(sender_id, msg)
 
     def run(self):
         """Thread running function"""
         try:
             while self.running:
                 # Parse incoming data
-                c = self.ser.read(1)
-                if len(c) == 1:
-                    if self.trans.parse_byte(c):
-                        try:
-                            (sender_id, receiver_id, component_id, msg) = self.trans.unpack()
-                        except ValueError as e:
-                            logger.warning("Ignoring unknown message, %s" % e)
-                        else:
-                            if self.verbose:  # See the note on the same line in v1.0
-                                logger.info("New incoming message '%s' from %i (%i) to %i" % (msg.name, sender_id, component_id, receiver_id))
-                            # Callback function on new message
-                            if self.id == receiver_id:
-                                self.callback(sender_id, msg)
+                data = self.read()
+                if not data:
+                    continue
+                if self.read_mode == READ_BYTE:
+                    if self.trans.parse_byte(data):
+                        self.process_frame(self.trans.get_buffer())
+                else:
+                    for frame in self.trans.feed(data):
+                        self.process_frame(frame)
 
         except StopIteration:
             pass
@@ -108,10 +245,15 @@ def test():
     parser.add_argument("-b", "--baudrate", help="baudrate", dest='baud', default=115200, type=int)
     parser.add_argument("-id", "--ac_id", help="aircraft id (receiver)", dest='ac_id', default=42, type=int)
     parser.add_argument("--interface_id", help="interface id (sender)", dest='id', default=0, type=int)
+    parser.add_argument("-r", "--read_mode", help="reader mode", dest='read_mode', default=READ_BYTE,
+                        choices=[READ_BYTE, READ_WAITING, READ_BLOCK])
+    parser.add_argument("-s", "--send_mode", help="sender mode", dest='send_mode', default=SEND_DIRECT,
+                        choices=[SEND_DIRECT, SEND_QUEUED])
     args = parser.parse_args()
     messages_xml_map.parse_messages(args.file)
     serial_interface = SerialMessagesInterface(lambda s, m: print("new message from %i: %s" % (s, m)), device=args.dev,
-                                               baudrate=args.baud, msg_class=args.msg_class, interface_id=args.id, verbose=True)
+                                               baudrate=args.baud, msg_class=args.msg_class, interface_id=args.id, verbose=True,
+                                               read_mode=args.read_mode, send_mode=args.send_mode)
 
     print("Starting serial interface on %s at %i baud" % (args.dev, args.baud))
     try:
@@ -23,11 +23,12 @@ from __future__ import absolute_import, division, print_function
 import threading
 import socket
 import logging
-import struct
+from contextlib import contextmanager
 
 # load pprzlink messages and transport
 from pprzlink.message import PprzMessage
 from pprzlink.pprz_transport import PprzTransport
+from pprzlink.mmsg import DatagramBatch
 
 # default port
 UPLINK_PORT = 4243
@@ -40,7 +41,11 @@ logger = logging.getLogger("PprzLink")
 class UdpMessagesInterface(threading.Thread):
     def __init__(self, callback, verbose=False,
                  uplink_port=UPLINK_PORT, downlink_port=DOWNLINK_PORT,
-                 msg_class='telemetry', interface_id=0):
+                 msg_class='telemetry', interface_id=0, buffer_size=2048, batch_size=0, use_mmsg=True):
+        """
+        :param batch_size: receive up to batch_size datagrams per wake-up and send batches at once
+            (recvmmsg/sendmmsg on Linux if use_mmsg), 0 to receive one datagram at a time
+        """
         threading.Thread.__init__(self)
         self.callback = callback
         self.verbose = verbose
@@ -59,6 +64,13 @@ class UdpMessagesInterface(threading.Thread):
             logger.error("Error: unable to open socket on ports '%d' (up) and '%d' (down)" % (self.uplink_port, self.downlink_port))
             exit(0)
         self.trans = PprzTransport(msg_class)
+        # datagrams are received in place and decoded from it, no allocation per datagram
+        self.buffer = bytearray(buffer_size)
+        self.timeout = 2.0
+        self.batch_io = DatagramBatch(self.server, batch_size, buffer_size, use_mmsg) if batch_size > 0 else None
+        self._batch = None      # datagrams of the current batch, see batch()
+        self._batch_lock = threading.Lock()
+        self.recorder = None    # FlightRecorder of the received frames
 
     def stop(self):
         logger.info("End thread and close UDP link")
@@ -79,10 +91,62 @@ class UdpMessagesInterface(threading.Thread):
 		#TODO use sender_id from constructor
         if isinstance(msg, PprzMessage):
             data = self.trans.pack_pprz_msg(sender_id, msg, receiver, component)
+            with self._batch_lock:
+                if self._batch is not None:
+                    self._batch.append((data, (address, self.uplink_port)))
+                    return
             try:
                 self.server.sendto(data, (address, self.uplink_port))
-            except:
-                pass # TODO better error handling
+            except OSError as e:
+                logger.error("Error: unable to send UDP message, %s" % e)
+
+    @contextmanager
+    def batch(self):
+        """
+        Send the messages sent within the block together when it ends, with one sendmmsg if available
+
+        Typically around one tick of the control loop, messages can be sent from any thread.
+        """
+        with self._batch_lock:
+            outer = self._batch is None
+            if outer:
+                self._batch = []
+        if not outer:
+            # nested, the outer batch sends everything
+            yield
+            return
+        try:
+            yield
+        finally:
+            with self._batch_lock:
+                datagrams, self._batch = self._batch, None
+            try:
+                if self.batch_io is not None:
+                    self.batch_io.send(datagrams)
+                else:
+                    for data, address in datagrams:
+                        self.server.sendto(data, address)
+            except OSError as e:
+                logger.error("Error: unable to send UDP batch, %s" % e)
+
+    def process_frame(self, data, address, length):
+        """Decode a complete message buffer and call the callback"""
+        if self.recorder is not None:
+            # recording never gets in the way of the callback
+            try:
+                self.recorder.record_frame(data)
+            except Exception:
+                logger.exception("Error while recording a frame")
+        try:
+            (sender_id, receiver_id, component_id, msg) = self.trans.unpack_pprz_msg(data)
+        except ValueError as e:
+            logger.warning("Ignoring unknown message, %s" % e)
+        else:
+            if self.verbose:
+                logger.info("New incoming message '%s' from %i (%i, %s) to %i" % (msg.name, sender_id, component_id, address, receiver_id))
+            # Callback function on new message
+            if self.id is None or self.id == receiver_id or receiver_id == 255:
+                self.callback(sender_id, address, msg, length, receiver_id, component_id)
 
     def run(self):
         """Thread running function"""
@@ -90,25 +154,21 @@ class UdpMessagesInterface(threading.Thread):
             while self.running:
                 # Parse incoming data
                 try:
-                    (msg, address) = self.server.recvfrom(2048)
-                    length = len(msg)
-                    for c in msg:
-                        #Compatibility with Python2 and Python3
-                        if not isinstance(c, bytes):
-                            c = struct.pack("B",c)
-                        if self.trans.parse_byte(c):
-                            try:
-                                (sender_id, receiver_id, component_id, msg) = self.trans.unpack()
-                            except ValueError as e:
-                                logger.warning("Ignoring unknown message, %s" % e)
-                            else:
-                                if self.verbose:
-                                    logger.info("New incoming message '%s' from %i (%i, %s) to %i" % (msg.name, sender_id, component_id, address, receiver_id))
-                                # Callback function on new message
-                                if self.id is None or self.id == receiver_id or receiver_id == 255:
-                                    self.callback(sender_id, address, msg, length, receiver_id, component_id)
+                    if self.batch_io is not None:
+                        buffer = self.batch_io.buffer
+                        for (offset, length, address) in self.batch_io.recv(self.timeout):
+                            for frame in self.trans.feed_view(buffer, length, offset):
+                                self.process_frame(frame, address, length)
+                        continue
+                    (length, address) = self.server.recvfrom_into(self.buffer)
+                    for frame in self.trans.feed_view(self.buffer, length):
+                        self.process_frame(frame, address, length)
                 except socket.timeout:
                     pass
+                except (OSError, ValueError):
+                    if self.running:
+                        raise
+                    # socket closed by stop
 
         except StopIteration:
             pass
@@ -0,0 +1,79 @@
+import time
+from math import floor, sqrt
+
+
+class FixedRateScheduler:
+    """
+    Fixed rate loop timing on the monotonic clock
+
+    Tick deadlines are multiples of the period from the start time, so compute time
+    does not accumulate as drift. A tick ending after the next deadline (by more than
+    tolerance) is an overrun. Whole missed periods are skipped instead of running a burst
+    of late ticks.
+    """
+    def __init__(self, rate=1./0.09, clock=time.monotonic, sleep=time.sleep, tolerance=1e-4):
+        self.period = 1. / rate
+        self.tolerance = tolerance
+        self._clock = clock
+        self._sleep = sleep
+        self.reset()
+
+    def reset(self):
+        self._start = None
+        self._next = None
+        self._last = None
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        # measured periods: running mean and sum of squared deviations (Welford), extremes
+        self._mean = 0.
+        self._m2 = 0.
+        self._min = float('inf')
+        self._max = 0.
+
+    def wait(self):
+        """Wait for the next tick, return the measured time since the previous one"""
+        if self._next is None:
+            self._start = self._last = self._clock()
+            self._next = self._start + self.period
+        delay = self._next - self._clock()
+        if delay > 0:
+            self._sleep(delay)
+        elif delay < -self.tolerance:
+            # the previous tick ended after this deadline
+            self.overruns += 1
+        now = self._clock()
+        late = now - self._next
+        self._next += self.period
+        if late >= self.period:
+            missed = floor(late / self.period)
+            self.skipped += missed
+            self._next += self.period * missed
+        dt = now - self._last
+        self._last = now
+        self._record(dt)
+        return dt
+
+    def _record(self, dt):
+        self.ticks += 1
+        delta = dt - self._mean
+        self._mean += delta / self.ticks
+        self._m2 += delta * (dt - self._mean)
+        self._min = min(self._min, dt)
+        self._max = max(self._max, dt)
+
+    def stats(self):
+        """Loop period statistics (s): jitter is the standard deviation of the measured period"""
+        if self.ticks == 0:
+            return {'ticks': 0, 'overruns': 0, 'skipped': 0}
+        return {
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'period': self.period,
+            'mean': self._mean,
+            'jitter': sqrt(self._m2 / self.ticks),
+            'min': self._min,
+            'max': self._max,
+            'max_error': max(self._max - self.period, self.period - self._min),
+        }
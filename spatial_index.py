@@ -0,0 +1,47 @@
+from math import ceil, floor
+import numpy as np
+
+
+class UniformGrid:
+    """
+    Uniform grid over 3D positions for neighbour queries within a radius
+
+    The grid is rebuilt from all the positions (O(N)) once per control tick,
+    a query only looks at the cells overlapping the query radius.
+    """
+    def __init__(self, cell_size=1.0):
+        self.cell_size = cell_size
+        self.ids = []
+        self.positions = np.zeros((0, 3))
+        self.cells = {}
+
+    def rebuild(self, ids, positions):
+        self.ids = list(ids)
+        self.positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+        self.cells = {}
+        keys = np.floor(self.positions / self.cell_size).astype(int).tolist()
+        for idx, key in enumerate(keys):
+            self.cells.setdefault(tuple(key), []).append(idx)
+
+    def query(self, position, radius=None, exclude=None):
+        """Indices of the positions within radius of position (all if radius is None), except id exclude"""
+        if radius is None:
+            return [idx for idx, _id in enumerate(self.ids) if _id != exclude]
+        n = int(ceil(radius / self.cell_size))
+        cx, cy, cz = (int(floor(p / self.cell_size)) for p in position[:3])
+        candidates = []
+        for i in range(cx - n, cx + n + 1):
+            for j in range(cy - n, cy + n + 1):
+                for k in range(cz - n, cz + n + 1):
+                    candidates.extend(self.cells.get((i, j, k), ()))
+        if exclude is not None:
+            candidates = [idx for idx in candidates if self.ids[idx] != exclude]
+        if not candidates:
+            return []
+        d = self.positions[candidates] - np.asarray(position[:3], dtype=float)
+        near = np.einsum('ij,ij->i', d, d) <= radius*radius
+        return [idx for idx, is_near in zip(candidates, near) if is_near]
+
+    def neighbours(self, position, radius=None, exclude=None):
+        """(M,3) array of the positions within radius of position, except id exclude"""
+        return self.positions[self.query(position, radius, exclude)]
@@ -0,0 +1,12 @@
+import os
+
+import pytest
+
+from pprzlink import messages_xml_map
+
+MESSAGES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pprzlink', 'messages.xml')
+
+
+@pytest.fixture(scope='session', autouse=True)
+def messages():
+    messages_xml_map.parse_messages(MESSAGES_FILE, use_cache=False)
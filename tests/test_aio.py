@@ -0,0 +1,34 @@
+import asyncio
+
+from pprzlink.aio import AioLink
+from pprzlink.message import PprzMessage
+from pprzlink.pprz_transport import PprzTransport
+
+
+def frames(count):
+    transport = PprzTransport()
+    data = b''
+    for i in range(count):
+        msg = PprzMessage('telemetry', 'ROTORCRAFT_FP')
+        msg['north'] = i
+        data += transport.pack_pprz_msg(1, msg)
+    return data
+
+
+def test_close_with_full_queue_keeps_messages():
+    async def run():
+        link = AioLink(maxsize=2)
+        link.feed(frames(2))
+        link.close()
+        return [incoming.msg['north'] async for incoming in link], link.dropped
+    assert asyncio.run(run()) == ([0, 1], 0)
+
+
+def test_close_wakes_waiting_consumer():
+    async def run():
+        link = AioLink()
+        waiting = asyncio.ensure_future(link.recv())
+        await asyncio.sleep(0)
+        link.close()
+        return await asyncio.wait_for(waiting, 1.)
+    assert asyncio.run(run()) is None
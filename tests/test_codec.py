@@ -0,0 +1,76 @@
+import struct
+
+import pytest
+
+from pprzlink.message import PprzMessage, PprzMessageError
+
+# binary formats and encoding of PprzMessage before the compiled codecs, as the reference
+BASELINE_TYPES = {'float': 'f', 'double': 'd', 'uint8': 'B', 'uint16': 'H', 'uint32': 'L',
+                  'int8': 'b', 'int16': 'h', 'int32': 'l', 'char': 'c'}
+
+
+def baseline_pack(fieldtypes, values):
+    fmt = '<'
+    data = []
+    for t, value in zip(fieldtypes, values):
+        base, _, array = t.partition('[')
+        code = BASELINE_TYPES[base]
+        if array:
+            if array == ']':
+                fmt += 'B'
+                data.append(len(value))
+            fmt += code * len(value)
+            data.extend(x.encode() if code == 'c' else x for x in value)
+        else:
+            fmt += code
+            data.append(value)
+    return struct.pack(fmt, *data)
+
+
+def roundtrip(msg_class, name, values):
+    msg = PprzMessage(msg_class, name)
+    msg.set_values(values)
+    data = msg.payload_to_binary()
+    assert data == baseline_pack(msg.fieldtypes, values)
+    decoded = PprzMessage(msg_class, name)
+    decoded.binary_to_payload(data)
+    return decoded
+
+
+def test_scalars():
+    values = [1, -2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15]
+    assert roundtrip('telemetry', 'ROTORCRAFT_FP', values).fieldvalues == values
+
+
+@pytest.mark.parametrize('array_length', [0, 1, 5])
+def test_fixed_and_variable_arrays(array_length):
+    # uint8, char[], uint8, int16[], uint16[3], float[4]
+    values = [1, list('ab' * array_length), 2, list(range(-array_length, array_length)), [1, 2, 3],
+              [0.5, 1.5, -2., 4.]]
+    decoded = roundtrip('telemetry', 'JEVOIS', values).fieldvalues
+    assert decoded[1] == [c.encode() for c in values[1]]
+    assert decoded[:1] + decoded[2:] == values[:1] + values[2:]
+
+
+def test_fixed_char_array():
+    values = [1, 2, 3, list('abcde'), 2.5, [1., 2.]]
+    decoded = roundtrip('datalink', 'MISSION_CUSTOM', values).fieldvalues
+    assert decoded[3] == [b'a', b'b', b'c', b'd', b'e']
+    assert decoded[4:] == values[4:]
+
+
+def test_conversion_fallback():
+    # strings from an untyped Ivy message are converted when packing
+    msg = PprzMessage('datalink', 'DESIRED_SETPOINT')
+    msg.set_values(['3', '1', '0.5', '-2', '4.25'])
+    assert msg.payload_to_binary() == baseline_pack(msg.fieldtypes, [3, 1, 0.5, -2., 4.25])
+    msg = PprzMessage('telemetry', 'PAYLOAD')
+    msg.set_values([['1', '2', '255']])
+    assert msg.payload_to_binary() == b'\x03\x01\x02\xff'
+
+
+def test_no_binary_format():
+    msg = PprzMessage('ground', 'NEW_AIRCRAFT')
+    msg.set_values(['1'])
+    with pytest.raises(PprzMessageError):
+        msg.payload_to_binary()
@@ -0,0 +1,29 @@
+import threading
+import time
+
+from pprzlink.dispatcher import Dispatcher, DROP_OLDEST
+from pprzlink.message import PprzMessage
+
+
+def test_only_opted_in_messages_are_dropped():
+    gate = threading.Event()
+    received = []
+
+    def callback(ac_id, msg):
+        gate.wait()
+        received.append((msg.name, ac_id))
+
+    dispatcher = Dispatcher(callback, maxsize=2, policies={'ROTORCRAFT_FP': DROP_OLDEST})
+    for i in range(5):
+        dispatcher(i, PprzMessage('telemetry', 'ROTORCRAFT_FP'))
+        dispatcher(i, PprzMessage('telemetry', 'PONG'))
+    gate.set()
+    deadline = time.monotonic() + 5.
+    while (any(s['delivered'] + s['dropped'] < s['queued'] for s in dispatcher.stats().values())
+           and time.monotonic() < deadline):
+        time.sleep(0.01)
+    dispatcher.stop()
+    stats = dispatcher.stats()
+    assert stats['PONG']['dropped'] == 0
+    assert [ac_id for name, ac_id in received if name == 'PONG'] == list(range(5))
+    assert stats['ROTORCRAFT_FP']['dropped'] > 0
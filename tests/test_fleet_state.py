@@ -0,0 +1,78 @@
+import numpy as np
+
+from fleet_state import FleetState
+
+
+def test_slots_and_grow():
+    fleet = FleetState(capacity=2)
+    slots = [fleet.add(ac_id) for ac_id in (10, 11, 12, 13, 14)]
+    assert slots == [0, 1, 2, 3, 4]
+    assert fleet.add(12) == 2
+    assert len(fleet.position) >= 5
+    assert fleet.slot(14) == 4
+    assert fleet.slot(99) is None
+    assert len(fleet) == 5 and 13 in fleet
+
+
+def test_grow_keeps_state():
+    fleet = FleetState(capacity=1)
+    fleet.position[fleet.add(1)] = (1., 2., 3.)
+    fleet.touch(0)
+    fleet.add(2)
+    fleet.velocity[fleet.slot(2)] = (4., 5., 6.)
+    assert np.array_equal(fleet.position[0], (1., 2., 3.))
+    assert np.array_equal(fleet.velocity[1], (4., 5., 6.))
+    assert list(fleet.updated_slots()) == [0]
+
+
+def test_remove_reuses_cleared_slot():
+    fleet = FleetState(capacity=4)
+    for ac_id in (1, 2, 3):
+        fleet.add(ac_id)
+    fleet.position[fleet.slot(2)] = (1., 1., 1.)
+    fleet.touch(fleet.slot(2))
+    fleet.remove(2)
+    fleet.remove(42)
+    assert 2 not in fleet and len(fleet) == 2
+    assert fleet.ids == [1, None, 3]
+    assert fleet.add(4) == 1
+    assert np.array_equal(fleet.position[1], (0., 0., 0.))
+    assert fleet.timestamp[1] == 0.
+    assert fleet.add(5) == 3
+
+
+class Vehicle(object):
+    def __init__(self, ac_id, fleet):
+        self.id = ac_id
+        self.slot = fleet.add(ac_id)
+
+
+def test_registry_update():
+    from fleet_state import VehicleRegistry
+
+    fleet = FleetState()
+    registry = VehicleRegistry(fleet)
+    added, removed = registry.update([1, 2, 3], lambda ac_id: Vehicle(ac_id, fleet))
+    assert [v.id for v in added] == [1, 2, 3] and removed == []
+    first = registry.get(1)
+    added, removed = registry.update([1, 3, 4], lambda ac_id: Vehicle(ac_id, fleet))
+    assert [v.id for v in added] == [4] and [v.id for v in removed] == [2]
+    assert registry.get(1) is first and registry.get(2) is None
+    # the slot of the vehicle that left is reused
+    assert registry.get(4).slot == 1
+    assert [v.id for v in registry] == [1, 3, 4]
+    assert 2 not in fleet
+
+
+def test_snapshot_is_isolated():
+    fleet = FleetState(capacity=2)
+    fleet.position[fleet.add(1)] = (1., 2., 3.)
+    snap = fleet.snapshot()
+    fleet.position[0] = (9., 9., 9.)
+    fleet.add(2)
+    fleet.add(3)
+    snap.position[0, 0] = -1.
+    assert np.array_equal(snap.position[0], (-1., 2., 3.))
+    assert np.array_equal(fleet.position[0], (9., 9., 9.))
+    assert snap.ids == [1] and 2 not in snap
+    assert snap.slot(1) == fleet.slot(1)
@@ -0,0 +1,35 @@
+import numpy as np
+
+from pprzlink.log_export import load_tables
+from pprzlink.message import PprzMessage
+from pprzlink.pprz_transport import PprzTransport
+from pprzlink.recorder import FlightRecorder
+
+
+def test_load_tables_across_segments(tmp_path):
+    recorder = FlightRecorder(str(tmp_path), segment_records=7)
+    transport = PprzTransport()
+    for i in range(20):
+        msg = PprzMessage('telemetry', 'ROTORCRAFT_FP' if i % 2 else 'DL_VALUE')
+        if i % 2:
+            msg['north'] = i
+        else:
+            msg['index'] = i
+            msg['value'] = i / 2.
+        recorder.record_frame(transport.feed(transport.pack_pprz_msg(i % 3, msg))[0], timestamp=float(i))
+        recorder.record_command(1, 0, 0., 0., 0.)
+    recorder.close()
+    tables, index = load_tables(str(tmp_path))
+    assert sorted(tables) == ['telemetry.DL_VALUE', 'telemetry.ROTORCRAFT_FP']
+    fp = tables['telemetry.ROTORCRAFT_FP']
+    assert list(fp['north']) == list(range(1, 20, 2))
+    assert list(fp['_sender_id']) == [i % 3 for i in range(1, 20, 2)]
+    assert np.all(np.diff(fp['_timestamp']) > 0)
+    assert list(index['timestamp']) == [float(i) for i in range(20)]
+    assert list(index['row']) == [i // 2 for i in range(20)]
+
+
+def test_load_tables_empty(tmp_path):
+    tables, index = load_tables(str(tmp_path))
+    assert tables == {}
+    assert len(index) == 0
@@ -0,0 +1,28 @@
+from pprzlink.mailbox import Mailbox
+from pprzlink.message import PprzMessage
+
+
+def fp(north):
+    msg = PprzMessage('telemetry', 'ROTORCRAFT_FP')
+    msg['north'] = north
+    return msg
+
+
+def test_conflation():
+    mailbox = Mailbox()
+    for north in range(3):
+        mailbox(1, fp(north))
+    seq, samples = mailbox.updates()
+    assert [(s[0], s[3]['north']) for s in samples] == [(1, 2)]
+    assert mailbox.updates(seq) == (seq, [])
+
+
+def test_updates_out_of_order_timestamps():
+    # a writer stamps a sample, another one stores a newer sample first
+    mailbox = Mailbox()
+    mailbox.put(1, fp(1), timestamp=2.)
+    seq, samples = mailbox.updates()
+    assert len(samples) == 1
+    mailbox.put(2, fp(2), timestamp=1.)
+    seq, samples = mailbox.updates(seq)
+    assert [(s[0], s[2]) for s in samples] == [(2, 1.)]
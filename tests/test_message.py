@@ -0,0 +1,40 @@
+import pytest
+
+from pprzlink.message import PprzMessage, PprzMessageError
+
+
+FP = '1 2 3 4 5 6 7 8 9 10 11 12 13 14 15'
+
+
+def test_ivy_string_typed():
+    msg = PprzMessage('telemetry', 'ROTORCRAFT_FP')
+    msg.ivy_string_to_payload(FP, typed=True)
+    assert msg['north'] == 2
+    assert isinstance(msg['north'], int)
+
+
+def test_ivy_string_typed_invalid_value():
+    msg = PprzMessage('telemetry', 'ROTORCRAFT_FP')
+    with pytest.raises(PprzMessageError):
+        msg.ivy_string_to_payload(FP.replace(' 2 ', ' nan? '), typed=True)
+    # untyped messages keep the strings
+    msg.ivy_string_to_payload(FP.replace(' 2 ', ' nan? '))
+    assert msg['north'] == 'nan?'
+
+
+def test_ivy_string_typed_other_classes():
+    msg = PprzMessage('telemetry', 'DL_VALUE')
+    msg.ivy_string_to_payload('1 2.5', typed=True)
+    assert msg['value'] == 2.5
+    msg = PprzMessage('datalink', 'DESIRED_SETPOINT')
+    with pytest.raises(PprzMessageError):
+        msg.ivy_string_to_payload('3 0 1.0 x 3.0', typed=True)
+
+
+def test_ivy_parse_ignores_invalid_typed_message():
+    pytest.importorskip('ivy.std_api')
+    from pprzlink.ivy import IvyMessagesInterface
+
+    assert IvyMessagesInterface.parse_pprz_msg('1 ROTORCRAFT_FP ' + FP.replace(' 2 ', ' x '), typed=True) is None
+    ac_id, _, msg = IvyMessagesInterface.parse_pprz_msg('1 ROTORCRAFT_FP ' + FP, typed=True)
+    assert (ac_id, msg['north']) == (1, 2)
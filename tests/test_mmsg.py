@@ -0,0 +1,75 @@
+import socket
+
+import pytest
+
+from pprzlink.message import PprzMessage
+from pprzlink.mmsg import DatagramBatch, mmsg_available
+from pprzlink.udp import UdpMessagesInterface
+
+USE_MMSG = [False, pytest.param(True, marks=pytest.mark.skipif(not mmsg_available(), reason="no recvmmsg"))]
+
+
+@pytest.fixture
+def sockets():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.settimeout(2.)
+    receiver.bind(('127.0.0.1', 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.bind(('127.0.0.1', 0))
+    yield receiver, sender
+    receiver.close()
+    sender.close()
+
+
+@pytest.mark.parametrize('use_mmsg', USE_MMSG)
+def test_recv(sockets, use_mmsg):
+    receiver, sender = sockets
+    batch = DatagramBatch(receiver, batch_size=4, buffer_size=64, use_mmsg=use_mmsg)
+    for i in range(6):
+        sender.sendto(bytes([i]) * (i + 1), receiver.getsockname())
+    data = []
+    addresses = set()
+    for _ in range(2):
+        # datagrams are only valid until the next recv
+        for offset, length, address in batch.recv(1.):
+            data.append(bytes(batch.buffer[offset:offset + length]))
+            addresses.add(address)
+    assert data == [bytes([i]) * (i + 1) for i in range(6)]
+    assert addresses == {sender.getsockname()}
+    assert batch.recv(0.) == []
+    # the socket keeps its timeout, for the sends of other threads
+    assert receiver.gettimeout() == 2.
+
+
+@pytest.mark.parametrize('use_mmsg', USE_MMSG)
+def test_send(sockets, use_mmsg):
+    receiver, sender = sockets
+    batch = DatagramBatch(sender, batch_size=2, use_mmsg=use_mmsg)
+    # more datagrams than batch_size
+    batch.send([(b'%d' % i, receiver.getsockname()) for i in range(5)])
+    assert [receiver.recv(64) for _ in range(5)] == [b'%d' % i for i in range(5)]
+    assert batch.sent == 5
+
+
+@pytest.mark.parametrize('use_mmsg', USE_MMSG)
+def test_interface_batch(sockets, use_mmsg):
+    receiver, _ = sockets
+    interface = UdpMessagesInterface(None, uplink_port=receiver.getsockname()[1], downlink_port=0,
+                                     batch_size=4, use_mmsg=use_mmsg)
+    try:
+        receiver.settimeout(0.1)
+        with interface.batch():
+            for i in range(3):
+                msg = PprzMessage('datalink', 'DESIRED_SETPOINT')
+                msg['ac_id'] = i
+                with interface.batch():
+                    interface.send(msg, 0, '127.0.0.1')
+            with pytest.raises(socket.timeout):
+                receiver.recv(64)
+        ac_ids = [interface.trans.feed(receiver.recv(64))[0][4] for _ in range(3)]
+        assert ac_ids == [0, 1, 2]
+        # outside of a batch, the message is sent at once on the blocking socket
+        interface.send(msg, 0, '127.0.0.1')
+        assert receiver.recv(64)
+    finally:
+        interface.stop()
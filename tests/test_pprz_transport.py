@@ -0,0 +1,107 @@
+from pprzlink.message import PprzMessage
+from pprzlink.pprz_transport import PprzTransport, STX, MIN_FRAME_LENGTH
+
+
+def fp_frame(north, sender=1):
+    msg = PprzMessage('telemetry', 'ROTORCRAFT_FP')
+    msg['north'] = north
+    return PprzTransport().pack_pprz_msg(sender, msg)
+
+
+def parse_bytes(data):
+    """Reference: the per byte parser"""
+    transport = PprzTransport()
+    frames = []
+    for i in range(len(data)):
+        if transport.parse_byte(data[i:i + 1]):
+            frames.append(bytes(transport.get_buffer()))
+    return frames
+
+
+def feed(chunks):
+    transport = PprzTransport()
+    frames = []
+    for chunk in chunks:
+        frames.extend(bytes(f) for f in transport.feed(chunk))
+    return frames
+
+
+def decode(frames):
+    transport = PprzTransport()
+    return [transport.unpack_pprz_msg(f)[3]['north'] for f in frames]
+
+
+def test_frame_split_across_calls():
+    data = fp_frame(1) + fp_frame(2) + fp_frame(3)
+    for cut in range(1, len(data)):
+        assert feed([data[:cut], data[cut:]]) == parse_bytes(data)
+    assert decode(feed([data[i:i + 1] for i in range(len(data))])) == [1, 2, 3]
+
+
+def test_bad_checksum_then_valid_frame():
+    bad = bytearray(fp_frame(1))
+    bad[-1] ^= 0xFF
+    data = b'\x00\x12' + bytes(bad) + fp_frame(2)
+    assert feed([data]) == parse_bytes(data)
+    assert decode(feed([data])) == [2]
+
+
+def test_short_length_byte():
+    # STX followed by a length below the smallest frame is not a frame start
+    for length in range(MIN_FRAME_LENGTH):
+        data = bytes([STX, length]) + fp_frame(4)
+        assert decode(feed([data])) == [4]
+        assert decode(feed([data[:2], data[2:]])) == [4]
+        if length < 4:
+            # rejected by the per byte parser too, from 4 it starts a frame
+            assert feed([data]) == parse_bytes(data)
+
+
+def test_stx_in_payload():
+    # 0x99 bytes in the header and payload
+    frame = fp_frame(STX | STX << 8, sender=STX)
+    assert frame.count(bytes([STX])) > 2
+    data = frame * 3
+    assert feed([data]) == parse_bytes(data)
+    assert decode(feed([data])) == [STX | STX << 8] * 3
+    assert feed([data[:20], data[20:50], data[50:]]) == parse_bytes(data)
+
+
+def test_truncated_frame():
+    # a frame cut by a transmission error: the per byte parser takes the next frame as its payload
+    # and loses it, feed resynchronizes on the next STX
+    frame = fp_frame(STX | STX << 8, sender=STX)
+    data = frame + frame[:10] + frame + frame
+    frames = feed([data])
+    assert decode(frames) == [STX | STX << 8] * 3
+    assert set(parse_bytes(data)) <= set(frames)
+
+
+def test_feed_view_bounds():
+    frames = fp_frame(1) + fp_frame(2)
+    buffer = bytearray(frames + fp_frame(3) + b'\x00' * 7)
+    # the third frame is past the end
+    views = PprzTransport.feed_view(buffer, len(frames))
+    assert all(isinstance(v, memoryview) for v in views)
+    assert decode(views) == [1, 2]
+    # trailing partial frame in range is ignored
+    assert decode(PprzTransport.feed_view(buffer, len(frames) + 10)) == [1, 2]
+    assert decode(PprzTransport.feed_view(buffer, len(frames) + len(fp_frame(3)))) == [1, 2, 3]
+    assert decode(PprzTransport.feed_view(buffer)) == [1, 2, 3]
+    assert PprzTransport.feed_view(buffer, 4) == []
+
+
+def test_feed_view_matches_feed():
+    data = bytearray(fp_frame(STX | STX << 8, sender=STX) * 2 + fp_frame(5))
+    assert [bytes(v) for v in PprzTransport.feed_view(data)] == feed([data])
+    assert decode(PprzTransport.feed_view(data)) == [STX | STX << 8] * 2 + [5]
+
+
+def test_feed_view_offset():
+    frames = fp_frame(1) + fp_frame(2)
+    buffer = bytearray(b'\x00' * 5 + frames + fp_frame(3) + b'\x00' * 7)
+    assert decode(PprzTransport.feed_view(buffer, len(frames), 5)) == [1, 2]
+    # trailing partial frame in range is ignored
+    assert decode(PprzTransport.feed_view(buffer, len(frames) + 10, 5)) == [1, 2]
+    assert decode(PprzTransport.feed_view(buffer, None, 5 + len(fp_frame(1)))) == [2, 3]
+    assert PprzTransport.feed_view(buffer, 4, 5) == []
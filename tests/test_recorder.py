@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from pprzlink.message import PprzMessage
+from pprzlink.recorder import FlightLog, FlightRecorder, REC_FRAME
+
+
+DESIRED_SETPOINT = 'gcs DESIRED_SETPOINT 3 0 1.0 2.0 3.0'
+
+
+def setpoint():
+    msg = PprzMessage('datalink', 'DESIRED_SETPOINT')
+    msg.set_values([3, 0, 1., 2., 3.])
+    return msg
+
+
+def test_record_message_converts_sender_id(tmp_path):
+    recorder = FlightRecorder(str(tmp_path))
+    recorder.record_message('3', setpoint())
+    recorder.close()
+    records = list(FlightLog(str(tmp_path)).records([REC_FRAME]))
+    assert len(records) == 1
+    assert records[0][3][0] == 3
+
+
+def test_record_message_skips_bad_sender_id(tmp_path):
+    recorder = FlightRecorder(str(tmp_path))
+    recorder.record_message('gcs', setpoint())
+    recorder.record_message(None, setpoint())
+    recorder.close()
+    assert recorder.records == 0
+
+
+class FailingRecorder(object):
+    def record_message(self, *args, **kwargs):
+        raise RuntimeError("disk full")
+
+
+@pytest.mark.parametrize('recorder', [None, 'log', FailingRecorder()])
+def test_ivy_callback_with_recorder(tmp_path, recorder):
+    pytest.importorskip('ivy.std_api')
+    from pprzlink.ivy import IvyMessagesInterface
+
+    interface = IvyMessagesInterface(start_ivy=False)
+    bound = []
+    interface.bind_raw = lambda callback, regex: bound.append(callback)
+    interface.recorder = FlightRecorder(str(tmp_path)) if recorder == 'log' else recorder
+    received = []
+    interface.subscribe(lambda ac_id, msg: received.append((ac_id, msg)))
+    # untyped interface: ac_id is the string of the ac_id field
+    bound[0]('agent', DESIRED_SETPOINT)
+    assert len(received) == 1
+    assert received[0][0] == '3'
+    assert received[0][1].name == 'DESIRED_SETPOINT'
+
+
+def payload(size):
+    msg = PprzMessage('telemetry', 'PAYLOAD')
+    msg['values'] = list(range(size))
+    return msg
+
+
+def test_frames_fit_in_a_pprz_frame(tmp_path):
+    recorder = FlightRecorder(str(tmp_path))
+    # 4 bytes of header, 1 byte of array length
+    recorder.record_message(1, payload(246))
+    recorder.record_message(1, payload(250))
+    with pytest.raises(ValueError):
+        recorder.record_frame(bytes(252))
+    recorder.close()
+    records = list(FlightLog(str(tmp_path)).records([REC_FRAME]))
+    assert [len(r[3]) for r in records] == [251]
+
+
+def test_segments_are_allocated(tmp_path):
+    recorder = FlightRecorder(str(tmp_path), segment_records=1000)
+    path = FlightLog(str(tmp_path)).segments()[0]
+    stat = os.stat(path)
+    assert stat.st_blocks * 512 >= stat.st_size
+    recorder.close()
+
+
+class SendingInterface(object):
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+
+class BrokenRecorder(object):
+    def record_command(self, *args):
+        raise OSError("disk full")
+
+
+def test_command_sent_when_recording_fails():
+    from mission_control import Commands
+
+    interface = SendingInterface(BrokenRecorder())
+    Commands(3, interface).accelerate(1., 2., 3.)
+    assert [m.name for m in interface.sent] == ['DESIRED_SETPOINT']
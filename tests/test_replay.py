@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from pprzlink.message import PprzMessage
+from pprzlink.pprz_transport import PprzTransport
+from pprzlink.recorder import FlightRecorder, REC_FRAME
+from pprzlink.replay import ReplayMessagesInterface
+
+
+def record_log(directory, count=5, interval=0.05):
+    """count ROTORCRAFT_FP from 1 and 2 to 0 and 1, then one PONG, interval seconds apart"""
+    recorder = FlightRecorder(directory)
+    transport = PprzTransport()
+    for i in range(count):
+        msg = PprzMessage('telemetry', 'ROTORCRAFT_FP')
+        msg['north'] = i
+        frame = transport.pack_pprz_msg(1 + i % 2, msg, receiver=i % 2)
+        recorder.record_frame(transport.feed(frame)[0], timestamp=100. + i * interval)
+    recorder.record_message(3, PprzMessage('telemetry', 'PONG'), timestamp=100. + count * interval)
+    recorder.close()
+    return directory
+
+
+def replay(directory, **kwargs):
+    received = []
+    interface = ReplayMessagesInterface(lambda sender_id, msg: received.append((sender_id, msg.name)),
+                                        directory, **kwargs)
+    return interface, received
+
+
+def test_as_fast_as_possible_and_speed(tmp_path):
+    log = record_log(str(tmp_path))
+    interface, received = replay(log, speed=0, interface_id=None)
+    start = time.monotonic()
+    interface.run()
+    assert time.monotonic() - start < 0.1
+    assert len(received) == 6
+    assert interface.finished.is_set()
+
+    interface, received = replay(log, speed=2., interface_id=None)
+    start = time.monotonic()
+    interface.run()
+    # 0.25 s of log at twice real time
+    assert 0.12 <= time.monotonic() - start < 0.5
+    assert len(received) == 6
+
+
+def test_interface_id(tmp_path):
+    log = record_log(str(tmp_path))
+    interface, received = replay(log, speed=0, interface_id=1)
+    interface.run()
+    assert received == [(2, 'ROTORCRAFT_FP'), (2, 'ROTORCRAFT_FP')]
+    assert interface.replayed == 6
+
+
+def test_subscribe(tmp_path):
+    log = record_log(str(tmp_path))
+    interface, _ = replay(log, speed=0)
+    by_msg = []
+    by_regex = []
+    interface.subscribe(lambda ac_id, msg: by_msg.append(msg['north']), PprzMessage('telemetry', 'ROTORCRAFT_FP'))
+    bind_id = interface.subscribe(lambda ac_id, msg: by_regex.append((ac_id, msg.name)), '^2 ')
+    interface.subscribe(lambda ac_id, msg: by_regex.append((ac_id, msg.name)), 'PONG')
+    interface.run()
+    assert by_msg == [0, 1, 2, 3, 4]
+    assert by_regex == [(2, 'ROTORCRAFT_FP'), (2, 'ROTORCRAFT_FP'), (3, 'PONG')]
+    interface.unsubscribe(bind_id)
+    del by_regex[:]
+    interface.play()
+    assert by_regex == [(3, 'PONG')]
+
+
+def test_loop(tmp_path):
+    log = record_log(str(tmp_path))
+    interface, received = replay(log, speed=0, interface_id=None, loop=True)
+    interface.start()
+    deadline = time.monotonic() + 5.
+    while interface.replayed < 20 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    interface.stop()
+    assert interface.finished.wait(5.)
+    assert interface.replayed >= 20
+
+
+def test_skips_records_not_fitting_a_frame(tmp_path):
+    recorder = FlightRecorder(str(tmp_path))
+    recorder.record(REC_FRAME, bytes(256), timestamp=1.)
+    recorder.record_message(1, PprzMessage('telemetry', 'PONG'), timestamp=2.)
+    recorder.close()
+    interface, received = replay(str(tmp_path), speed=0, interface_id=None)
+    interface.run()
+    assert received == [(1, 'PONG')]
+    assert interface.skipped == 1
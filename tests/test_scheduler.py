@@ -0,0 +1,56 @@
+import pytest
+
+from scheduler import FixedRateScheduler
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.now += delay
+
+
+def scheduler(clock):
+    return FixedRateScheduler(rate=10., clock=clock, sleep=clock.sleep)
+
+
+def test_on_time():
+    clock = FakeClock()
+    s = scheduler(clock)
+    for _ in range(5):
+        assert s.wait() == pytest.approx(0.1)
+        clock.now += 0.05
+    assert s.stats()['overruns'] == 0
+    assert s.stats()['skipped'] == 0
+
+
+def test_overrun_shorter_than_a_period():
+    clock = FakeClock()
+    s = scheduler(clock)
+    s.wait()
+    clock.now += 0.15  # next deadline missed by 50 ms
+    assert s.wait() == pytest.approx(0.15)
+    assert s.overruns == 1
+    assert s.skipped == 0
+    # back on the original grid
+    clock.now += 0.01
+    assert s.wait() == pytest.approx(0.05)
+    assert s.overruns == 1
+
+
+def test_overrun_skips_missed_periods():
+    clock = FakeClock()
+    s = scheduler(clock)
+    start = clock.now
+    s.wait()
+    clock.now += 0.35  # deadlines at +0.2, +0.3 missed
+    s.wait()
+    assert s.overruns == 1
+    assert s.skipped == 2
+    s.wait()
+    assert clock.now == pytest.approx(start + 0.5)
+    assert s.stats()['overruns'] == 1
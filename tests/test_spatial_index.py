@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from spatial_index import UniformGrid
+
+
+def brute_force(positions, ids, position, radius, exclude):
+    d = np.linalg.norm(positions - position, axis=1)
+    return sorted(i for i in range(len(ids)) if ids[i] != exclude and (radius is None or d[i] <= radius))
+
+
+@pytest.mark.parametrize('cell_size', [0.5, 2., 7.])
+def test_query_matches_brute_force(cell_size):
+    rng = np.random.default_rng(0)
+    positions = rng.uniform(-10., 10., (200, 3))
+    ids = list(range(100, 300))
+    grid = UniformGrid(cell_size)
+    grid.rebuild(ids, positions)
+    for idx in range(0, 200, 7):
+        for radius in (None, 0.5, 3., 12.):
+            expected = brute_force(positions, ids, positions[idx], radius, ids[idx])
+            assert sorted(grid.query(positions[idx], radius, exclude=ids[idx])) == expected
+            assert len(grid.neighbours(positions[idx], radius, exclude=ids[idx])) == len(expected)
+
+
+def test_radius_boundary_is_included():
+    grid = UniformGrid(1.)
+    grid.rebuild([1, 2, 3], [(0., 0., 0.), (2., 0., 0.), (-2.5, 0., 0.)])
+    assert grid.query((0., 0., 0.), 2., exclude=1) == [1]
+    assert np.array_equal(grid.neighbours((0., 0., 0.), 2., exclude=1), [(2., 0., 0.)])
+    assert UniformGrid().query((0., 0., 0.), 1.) == []
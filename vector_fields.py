@@ -27,7 +27,8 @@ class ParametricTrajectory:
         self.alpha = alpha
         self.ctr = controller
 
-    def get_vector_field(self,x,y,z,w):
+    def _chi(self,x,y,z,w):
+        # x, y, z and w can be scalars or arrays of the same shape
         cx,cy,cz = self.XYZ_center
         wx,wy,wz = self.XYZ_w
         deltax,deltay,deltaz = self.XYZ_delta
@@ -71,10 +72,10 @@ class ParametricTrajectory:
         # print(f'Phi 1: {phi1:.4f}, Phi 2:{phi2:.4f}, Phi 3:{phi3:.4f}')
 
         #Chi, J
-        Chi = L*np.array([[-f1d*L*L*beta -k1*phi1],
-                          [-f2d*L*L*beta -k2*phi2],
-                          [-f3d*L*L*beta -k3*phi3],
-                          [-L*L + beta*(k1*phi1*f1d + k2*phi2*f2d + k3*phi3*f3d)]])
+        chi1 = L*(-f1d*L*L*beta -k1*phi1)
+        chi2 = L*(-f2d*L*L*beta -k2*phi2)
+        chi3 = L*(-f3d*L*L*beta -k3*phi3)
+        chi4 = L*(-L*L + beta*(k1*phi1*f1d + k2*phi2*f2d + k3*phi3*f3d))
 
         # j44 = beta*beta*(k1*(phi1*f1dd-L*f1d*f1d) + k2*(phi2*f2dd-L*f2d*f2d) + k3*(phi3*f3dd-L*f3d*f3d))
         # J = L*np.array([[-k1*L,        0,      0, -(beta*L)*(beta*L*f1dd-k1*f1d)],
@@ -105,12 +106,25 @@ class ParametricTrajectory:
 
     #     u_theta = (-(1/(Chit.dot(G).dot(Chi))*Chit.dot(Gp).dot(np.eye(4) - Chih.dot(Chih.transpose())).dot(J).dot(X_dot)) - ktheta*ht.dot(Fp).dot(Chi) / np.sqrt(Chit.dot(G).dot(Chi)))[0][0]
 
-        u_x = Chi[0][0]*s / np.sqrt(Chi[0][0]*Chi[0][0] + Chi[1][0]*Chi[1][0])
-        u_y = Chi[1][0]*s / np.sqrt(Chi[0][0]*Chi[0][0] + Chi[1][0]*Chi[1][0])
-        u_z = Chi[2][0]*s / np.sqrt(Chi[0][0]*Chi[0][0] + Chi[1][0]*Chi[1][0])
-        u_w = Chi[3][0]*s / np.sqrt(Chi[0][0]*Chi[0][0] + Chi[1][0]*Chi[1][0])
-        
-        return np.array([u_x, u_y, u_z]), np.array([u_w])
+        return chi1, chi2, chi3, chi4
+
+    def get_vector_field(self,x,y,z,w):
+        chi1, chi2, chi3, chi4 = self._chi(x, y, z, w)
+        # normalized by the horizontal norm of Chi
+        k = self.ctr.s / np.sqrt(chi1*chi1 + chi2*chi2)
+        return np.array([chi1*k, chi2*k, chi3*k]), np.array([chi4*k])
+
+    def get_vector_fields(self, positions, w):
+        """
+        Vector field for N positions at once
+
+        positions is an (N,3) array and w an (N,) array of trajectory parameters,
+        returns the (N,3) velocities and the (N,) u_w
+        """
+        positions = np.asarray(positions, dtype=float)
+        chi1, chi2, chi3, chi4 = self._chi(positions[:, 0], positions[:, 1], positions[:, 2], np.asarray(w, dtype=float))
+        k = self.ctr.s / np.sqrt(chi1*chi1 + chi2*chi2)
+        return np.stack((chi1*k, chi2*k, chi3*k), axis=-1), chi4*k
 
 
 class TrajectoryEllipse:
@@ -204,4 +218,10 @@ def repel(x,y,z, x_source=0., y_source=0., z_source=0., strength=2):
     u = strength / (2 * np.pi) * (x - x_source) / ((x - x_source)**2 + (y - y_source)**2 + (z - z_source)**2)
     v = strength / (2 * np.pi) * (y - y_source) / ((x - x_source)**2 + (y - y_source)**2 + (z - z_source)**2)
     w = strength / (2 * np.pi) * (z - z_source) / ((x - x_source)**2 + (y - y_source)**2 + (z - z_source)**2)
-    return np.array([u,v,w])
\ No newline at end of file
+    return np.array([u,v,w])
+
+def repel_sources(x,y,z, sources, strength=2):
+    """Sum of the repel fields of all the sources, sources is an (N,3) array of positions"""
+    d = np.array([x, y, z], dtype=float) - np.asarray(sources, dtype=float).reshape(-1, 3)
+    r2 = np.einsum('ij,ij->i', d, d)
+    return strength / (2 * np.pi) * (d / r2[:, None]).sum(axis=0)
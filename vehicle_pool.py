@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class VehiclePool:
+    """
+    Runs the vehicles of a control tick in parallel on a pool of threads
+
+    The vehicles are split into one shard per worker, run() returns once every
+    shard is done so a tick never overlaps the next one.
+    """
+    def __init__(self, workers=4):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='vehicle')
+
+    @staticmethod
+    def _run_shard(fn, shard):
+        for vehicle in shard:
+            fn(vehicle)
+
+    def run(self, vehicles, fn):
+        """Call fn(vehicle) for every vehicle and wait for all of them, errors are raised here"""
+        vehicles = list(vehicles)
+        shards = [vehicles[i::self.workers] for i in range(min(self.workers, len(vehicles)))]
+        futures = [self._executor.submit(self._run_shard, fn, shard) for shard in shards]
+        wait(futures)
+        for future in futures:
+            future.result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)